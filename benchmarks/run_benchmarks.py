@@ -0,0 +1,139 @@
+"""
+Benchmarks for the environment hot paths, no robot needed.
+
+python benchmarks/run_benchmarks.py                  # compare against benchmarks/baseline.json
+python benchmarks/run_benchmarks.py --save-baseline  # store the current numbers as the baseline
+
+Without a baseline file nothing is compared, --require-baseline turns that into exit code 2.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tools.util import rpytorotvec, rpytorotvec_batch, prepare_point, prepare_points
+from environment.main_environment_ur5 import Environment
+from environment.sim_robot import SimRobot
+from tools.log_pipeline import LogPipeline
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BATCH = 1000
+
+
+def measure(function, repeat, items=1, warmup=10):
+    # per-call latencies in seconds, items is how many poses one call handles
+    for _ in range(warmup):
+        function()
+    latencies = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies[i] = time.perf_counter() - start
+
+    return {"ops_per_sec": float(repeat * items / latencies.sum()),
+            "p50_us": float(np.percentile(latencies, 50) * 1e6),
+            "p90_us": float(np.percentile(latencies, 90) * 1e6),
+            "p99_us": float(np.percentile(latencies, 99) * 1e6)}
+
+
+def run_benchmarks(repeat):
+    rng = np.random.default_rng(0)
+    env = Environment(SimRobot(), seed=0)
+    angles = rng.uniform(-80, 80, (BATCH, 3))
+    poses = env.sampler.sample(BATCH)
+    pose = tuple(poses[0])
+    # one fresh pose per call so check_point is measured without its cache, check_point_repeat is the cached path
+    check_poses = itertools.cycle(env.sampler.sample(repeat + 10))
+
+    # a whole scripted episode against a fast-forward stand-in that keeps every command it gets
+    episode_robot = SimRobot(record_commands=True)
+    episode_env = Environment(episode_robot, velocity=1.0, acceleration=9.5)
+
+    def episode():
+        episode_env.hard_code_solution()
+        episode_env.reset_task()
+
+    # a log call on the control path, through the rate limit and the queue to a handler that drops it
+    log = logging.getLogger("benchmark")
+    log.propagate = False
+    log_pipeline = LogPipeline(handlers=[logging.NullHandler()], logger=log)
+
+    results = {
+        "rpytorotvec": measure(lambda: rpytorotvec(angles[0]), repeat),
+        "rpytorotvec_batch": measure(lambda: rpytorotvec_batch(angles), repeat, items=BATCH),
+        "prepare_point": measure(lambda: prepare_point(pose), repeat),
+        "prepare_points": measure(lambda: prepare_points(poses), repeat, items=BATCH),
+        "pitch_rotvec": measure(lambda: env.pitch_rotvec.compute(pose[4]), repeat),
+        "pitch_rotvec_batch": measure(lambda: env.pitch_rotvec.batch(poses[:, 4]), repeat, items=BATCH),
+        "check_point": measure(lambda: env.check_point(tuple(next(check_poses))), repeat),
+        "check_point_repeat": measure(lambda: env.check_point(pose), repeat),
+        "validate_points": measure(lambda: env.validate_points(poses), repeat, items=BATCH),
+        "sample_pose": measure(env.sample_pose, repeat),
+        "sampler_batch": measure(lambda: env.sampler.sample(BATCH), repeat, items=BATCH),
+        "get_sample_poses": measure(lambda: env.get_sample_poses(BATCH), repeat, items=BATCH),
+        "episode": measure(episode, max(repeat // 100, 5), warmup=1),
+        "log_event": measure(lambda: log.info("Move completed"), repeat),
+    }
+    log_pipeline.stop()
+    results["episode"]["commands_per_episode"] = len(episode_robot.commands) / (max(repeat // 100, 5) + 1)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, values in results.items():
+        if name not in baseline:
+            continue
+        ratio = values["ops_per_sec"] / baseline[name]["ops_per_sec"]
+        flag = "REGRESSION" if ratio < 1 - threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:20s} {values['ops_per_sec']:14.1f} ops/s  x{ratio:5.2f} vs baseline  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed drop in ops/sec before flagging")
+    parser.add_argument('--require-baseline', action='store_true', help="fail instead of skipping the comparison without a baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmarks(args.repeat)
+
+    for name, values in results.items():
+        print(f"{name:20s} {values['ops_per_sec']:14.1f} ops/s  p50 {values['p50_us']:10.1f} us  "
+              f"p90 {values['p90_us']:10.1f} us  p99 {values['p99_us']:10.1f} us")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # no baseline ships with the repo, the numbers only mean something on the machine that saved them
+        print(f"NOT COMPARED: no baseline at {args.baseline}, run with --save-baseline first")
+        if args.require_baseline:
+            sys.exit(2)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+from environment.main_environment_ur5 import Environment, INVALID_ACTION_HOME
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEnvironment(Environment):
+    # Moves are sent with wait=False and awaited by polling the program state,
+    # so the control loop can plan the next action while the robot is moving
+    def __init__(self, robot, velocity=0.1, acceleration=0.5, seed=None, invalid_action_policy=INVALID_ACTION_HOME, oscillation=None):
+        super().__init__(robot, velocity=velocity, acceleration=acceleration, seed=seed,
+                         invalid_action_policy=invalid_action_policy, oscillation=oscillation)
+        self.move_sent_at = None
+        self.move_seen_running = False
+
+    def send_move(self, pose, vel=None, acc=None):
+        # sending a move while another is running preempts it, the controller replaces the running program
+        self.robot.movel(pose, acc=self.acc if acc is None else acc, vel=self.vel if vel is None else vel, wait=False)
+        self.move_sent_at = self.clock()
+        self.move_seen_running = False
+
+    def is_moving(self):
+        # the non blocking side of wait_for_program
+        if self.move_sent_at is None:
+            return False
+        finished, self.move_seen_running = self.program_finished(self.move_sent_at, self.move_seen_running)
+        if finished:
+            self.move_sent_at = None
+        return not finished
+
+    async def move_done(self):
+        while self.is_moving():
+            await asyncio.sleep(self.poll_period)
+
+    async def move(self, pose, vel=None, acc=None):
+        self.send_move(pose, vel=vel, acc=acc)
+        await self.move_done()
+
+    async def step(self, action):
+        # same checks as Environment.step, a rejected action leaves the arm where it is
+        desire_pose = self.action_pose(action)
+        if desire_pose is not None:
+            await self.move(desire_pose)
+        return self.get_state()
+
+    def preempt(self, action):
+        # replace the running move with a new action without waiting, await move_done() afterwards
+        # the path is checked from where the arm is now, a rejected action lets the running move finish
+        desire_pose = self.action_pose(action)
+        if desire_pose is None:
+            return False
+        self.send_move(desire_pose)
+        return True
+
+    def cancel(self):
+        self.robot.stopl(self.acc)
+        self.move_sent_at = None
+        logger.info("Move cancelled")
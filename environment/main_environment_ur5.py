@@ -1,17 +1,55 @@
 import math
-import random
 import logging
 import time
+import numpy as np
 
-logging.basicConfig(level=logging.INFO)
 import collections
 collections.Iterable = collections.abc.Iterable # Need this for math3d lib issues
 
-from tools.util import prepare_point
+from tools.util import prepare_point, prepare_points, linear_move_duration, PitchRotvec, rotvectoquat_batch, quattorpy_batch, slerp_batch
+from tools.kinematics import UR5Kinematics
+from environment.sampler import PoseSampler
+from environment.workspace_index import WorkspaceIndex, DEFAULT_DIRECTORY
+from environment.settle import SettleDetector
+from environment.state_cache import RealtimeStateCache
+from environment.servo_control import ServoController
+from environment.task_sensor import TASK_STATE_READY, TASK_STATE_SWINGING
+
+try:
+    from urx.urrobot import RobotException
+except ImportError:  # headless runs without urx
+    from environment.sim_robot import RobotException
+
+logger = logging.getLogger(__name__)
+
+# Reason codes returned by Environment.validate_points, bit flags so a pose can fail more than one check
+POSE_VALID = 0
+POSE_OUTSIDE_ELLIPSE = 1
+POSE_OUTSIDE_Y_BAND = 2
+POSE_PITCH_OUT_OF_RANGE = 4
+POSE_ROLL_YAW_MISMATCH = 8
+POSE_UNREACHABLE = 16
+POSE_NEAR_SINGULAR = 32
+
+# What check_point does with an invalid pose
+INVALID_ACTION_HOME = "home"        # send the robot to the home pose
+INVALID_ACTION_PROJECT = "project"  # move to the nearest valid pose instead
+INVALID_ACTION_REJECT = "reject"    # raise InvalidPoseError and do not move
+
+# Reset sequences reset_task can pick from, cheapest first
+RESET_SKIP = "skip"        # ball already in its start state, only homes the arm if it is not there
+RESET_DAMPING = "damping"  # ball out of the cup but swinging, home and touch the ground to stop it
+RESET_FULL = "full"        # ball in the cup or state unknown, tip it out first
+
+
+class InvalidPoseError(ValueError):
+    pass
 
 
 class Environment:
-    def __init__(self, robot, velocity=0.1, acceleration=0.5):
+    state_size = 12  # size of the array returned by get_state
+
+    def __init__(self, robot, velocity=0.1, acceleration=0.5, seed=None, invalid_action_policy=INVALID_ACTION_HOME, oscillation=None):
         self.robot = robot
 
         self.robot.set_tcp((0, 0, 0, 0, 0, 0))  # Set tool central point
@@ -20,9 +58,17 @@ class Environment:
         self.vel = velocity
         self.acc = acceleration
 
+        # simulated robots bring their own clock so waiting can be fast-forwarded
+        self.clock = getattr(robot, "clock", time.monotonic)
+        self.sleep = getattr(robot, "sleep", time.sleep)
+        self.poll_period = 0.008  # seconds between program state polls, one controller cycle
+        self.program_start_timeout = 0.2  # the controller takes a moment to report a new program as running
+        self.waypoint_tolerance = 0.005  # meters, a blended waypoint counts as reached within its radius plus this
+
         # Home Position
         self.home_position    = (0.14, -0.50, 0.40) # X, Y , Z
         self.home_orientation = (90.0, 0.0, 0.0)  # Roll, Pith , Yaw  in Degrees
+        self.home_joints = (math.radians(90), math.radians(-90), math.radians(90), math.radians(0), math.radians(90), math.radians(0))
 
         # Working Area
         self.h, self.k = (self.home_position[0], self.home_position[2])  # central_point in (x, z)
@@ -33,131 +79,608 @@ class Environment:
         self.min_angle_rotation = -80
         self.max_angle_rotation = 80
 
+        # Y axis is fixed to home, this is the allowed band around it
+        self.y_tolerance = 0.001
+
+        self.invalid_action_policy = invalid_action_policy
+        self.last_correction = 0.0  # correction distance of the last check_point, for the trainer to penalise
+
+        # step and execute_trajectory check the whole linear path, not only the target,
+        # with a sample every path_step meters or path_angle_step degrees of rotation
+        self.validate_paths = True
+        self.path_step = 0.01
+        self.path_angle_step = 1.0
+        self.path_angle_tolerance = 0.5  # degrees, roll and yaw read back from the arm are snapped to home within this
+
+        # UR5 IK to reject unreachable and near singular poses, set to None to only check the working area
+        self.kinematics = UR5Kinematics()
+        self.workspace_index = None  # precomputed reachability grid, see use_workspace_index
+
+        # Roll and yaw stay at home for every action, only pitch moves, so those poses take a closed form conversion
+        self.pitch_rotvec = PitchRotvec(self.home_orientation[0], self.home_orientation[2])
+
+        # Seeded sampler for actions inside the working area
+        self.sampler = PoseSampler((self.h, self.k), self.home_position[1], self.a, self.b,
+                                   (self.home_orientation[0], self.home_orientation[2]),
+                                   self.min_angle_rotation, self.max_angle_rotation, seed=seed)
+
+        # Latest joint and TCP samples from the realtime stream, only when the robot was created with use_rt=True
+        self.state_cache = RealtimeStateCache(robot)
+        if getattr(robot, "rtmon", None) is not None:
+            self.state_cache.start()
+            self.state_cache.wait_for_sample()
+
+        # Waits for the arm (and the ball when there is a signal for it) to stop moving, used in reset_task.
+        # oscillation is a callable returning the swing amplitude of the ball, without it every wait lasts at least 2 s
+        self.settle_detector = SettleDetector(robot, clock=self.clock, sleep=self.sleep, state_cache=self.state_cache,
+                                              oscillation=oscillation)
+
+        # Optional EpisodeRecorder, gets every pose that goes through check_point
+        self.recorder = None
+
+        # Optional WaypointScheduler, hard_code_solution then times every segment from the joint limits
+        self.scheduler = None
+
+        # Optional TaskSensor, without it reset_task always runs the full sequence
+        self.task_sensor = None
+        self.reset_log = []  # (branch, seconds) for every reset_task
+        self.reset_counts = {RESET_SKIP: 0, RESET_DAMPING: 0, RESET_FULL: 0}
+        self.reset_time = {RESET_SKIP: 0.0, RESET_DAMPING: 0.0, RESET_FULL: 0.0}
+
+    def attach_robot(self, robot):
+        # swap in a new connection to the arm, e.g. after the old one was lost
+        self.state_cache.stop()
+        self.robot = robot
+        self.robot.set_tcp((0, 0, 0, 0, 0, 0))
+        self.robot.set_payload(0.4, (0, 0, 0))
+
+        self.clock = getattr(robot, "clock", time.monotonic)
+        self.sleep = getattr(robot, "sleep", time.sleep)
+        self.settle_detector.robot = robot
+        self.settle_detector.clock = self.clock
+        self.settle_detector.sleep = self.sleep
+
+        self.state_cache = RealtimeStateCache(robot)
+        if getattr(robot, "rtmon", None) is not None:
+            self.state_cache.start()
+            self.state_cache.wait_for_sample()
+        self.settle_detector.state_cache = self.state_cache
+
+    def position_reasons(self, positions):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+        reasons = np.zeros(positions.shape[0], dtype=np.uint8)
 
-    def test_position(self, x, y, z):
         ellipse_eq = ((x - self.h) ** 2) / (self.a ** 2) + ((z - self.k) ** 2) / (self.b ** 2)
-        if ellipse_eq > 1:
-            logging.error("Point X o Z is outside the boundaries of the ellipse")
-            return False
-
-        y_tolerance = 0.001
-        y_min = self.home_position[1] - y_tolerance
-        y_max = self.home_position[1] + y_tolerance
-        if not (y_min <= y <= y_max):
-            logging.error(f"Y axis is outside the boundary, should be fixed to {self.home_position[1]}")
-            return False
-        return True
+        reasons[ellipse_eq > 1] |= POSE_OUTSIDE_ELLIPSE
+
+        y_min = self.home_position[1] - self.y_tolerance
+        y_max = self.home_position[1] + self.y_tolerance
+        reasons[(y < y_min) | (y > y_max)] |= POSE_OUTSIDE_Y_BAND
+        return reasons
+
+    def orientation_reasons(self, orientations):
+        orientations = np.asarray(orientations, dtype=np.float64).reshape(-1, 3)
+        r, p, y = orientations[:, 0], orientations[:, 1], orientations[:, 2]
+        reasons = np.zeros(orientations.shape[0], dtype=np.uint8)
+
+        reasons[(p < self.min_angle_rotation) | (p > self.max_angle_rotation)] |= POSE_PITCH_OUT_OF_RANGE
+        reasons[(r != self.home_orientation[0]) | (y != self.home_orientation[2])] |= POSE_ROLL_YAW_MISMATCH
+        return reasons
+
+    def current_joints(self):
+        # from the realtime stream when there is one, the scripted moves stay close to home otherwise
+        latest = self.state_cache.latest() if self.state_cache.running else None
+        if latest is None:
+            return np.array(self.home_joints)
+        return latest[1]
+
+    def kinematic_reasons(self, poses_ready, reference_joints=None):
+        # the IK branch nearest reference_joints is checked, the current joints by default
+        if reference_joints is None:
+            reference_joints = self.current_joints()
+        reachable, near_singular, joints = self.kinematics.check(poses_ready, reference_joints)
+        reasons = np.zeros(poses_ready.shape[0], dtype=np.uint8)
+        reasons[~reachable] |= POSE_UNREACHABLE
+        reasons[near_singular] |= POSE_NEAR_SINGULAR
+        return reasons
+
+    def validate_points(self, poses):
+        # poses (N, 6) x, y, z, roll, pitch, yaw -> (valid mask, reason codes), no logging so it is safe on big batches
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        reasons = self.position_reasons(poses[:, :3]) | self.orientation_reasons(poses[:, 3:])
+        if self.kinematics is not None:
+            # only the poses inside the working area are worth the IK
+            inside = reasons == POSE_VALID
+            if not inside.any():
+                pass
+            elif self.workspace_index is not None:
+                reasons[inside] |= self.workspace_index.kinematic_reasons(poses[inside])
+            else:
+                reasons[inside] |= self.kinematic_reasons(self.prepare_many(poses[inside]))
+        return reasons == POSE_VALID, reasons
+
+    def current_pose(self):
+        # x, y, z, rx, ry, rz from the realtime stream when there is one, asks the robot otherwise
+        latest = self.state_cache.latest() if self.state_cache.running else None
+        if latest is None:
+            return np.asarray(self.robot.getl(), dtype=np.float64)
+        return latest[2]
+
+    def path_samples(self, poses_ready, start_pose):
+        # samples along the movel segments start -> poses_ready[0] -> poses_ready[1] ...
+        # -> (segment index, fraction in (0, 1] along it, x, y, z, roll, pitch, yaw pose) for every sample
+        targets = np.asarray(poses_ready, dtype=np.float64).reshape(-1, 6)
+        starts = np.vstack((np.asarray(start_pose, dtype=np.float64).reshape(1, 6), targets[:-1]))
+        q0 = rotvectoquat_batch(starts[:, 3:])
+        q1 = rotvectoquat_batch(targets[:, 3:])
+
+        lengths = np.linalg.norm(targets[:, :3] - starts[:, :3], axis=1)
+        angles = np.degrees(2 * np.arccos(np.clip(np.abs(np.sum(q0 * q1, axis=1)), 0.0, 1.0)))
+        counts = np.maximum(np.ceil(np.maximum(lengths / self.path_step, angles / self.path_angle_step)), 1).astype(np.int64)
+
+        segment = np.repeat(np.arange(len(targets)), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        fraction = (np.arange(counts.sum()) - first + 1) / counts[segment]
+
+        # the start of every segment is the end of the one before, or where the arm already is
+        s = fraction[:, None]
+        samples = np.empty((len(segment), 6))
+        samples[:, :3] = (1 - s) * starts[segment, :3] + s * targets[segment, :3]
+        samples[:, 3:] = np.round(quattorpy_batch(slerp_batch(q0[segment], q1[segment], fraction)), 6)
+
+        # roll and yaw stay put on a path between valid poses, this only absorbs the noise in the measured start pose
+        return segment, fraction, self.snap_roll_yaw(samples)
+
+    def snap_roll_yaw(self, poses):
+        # roll and yaw within path_angle_tolerance of home count as home, in place
+        for column, home in ((3, self.home_orientation[0]), (5, self.home_orientation[2])):
+            close = np.abs(poses[:, column] - home) <= self.path_angle_tolerance
+            poses[close, column] = home
+        return poses
+
+    def measured_poses(self, poses_ready):
+        # (N, 6) x, y, z, rx, ry, rz as the arm reports them -> x, y, z, roll, pitch, yaw for validate_points
+        poses_ready = np.asarray(poses_ready, dtype=np.float64).reshape(-1, 6)
+        poses = np.empty_like(poses_ready)
+        poses[:, :3] = poses_ready[:, :3]
+        poses[:, 3:] = np.round(quattorpy_batch(rotvectoquat_batch(poses_ready[:, 3:])), 6)
+        return self.snap_roll_yaw(poses)
+
+    def validate_path(self, poses_ready, start_pose=None):
+        # poses_ready (N, 6) as sent to movel or movels, checked in one pass along the straight segments from start_pose
+        # (the current pose by default), blends are not sampled, they stay inside the convex working area anyway
+        # -> (valid, first violating point as segment index + fraction along it or None, its reason codes)
+        if start_pose is None:
+            start_pose = self.current_pose()
+        segment, fraction, samples = self.path_samples(poses_ready, start_pose)
+        valid, reasons = self.validate_points(samples)
+        if valid.all():
+            return True, None, POSE_VALID
+        first = int(np.argmax(~valid))
+        return False, float(segment[first] + fraction[first]), int(reasons[first])
+
+    def use_workspace_index(self, resolution=(0.01, 0.01, 2.0), directory=DEFAULT_DIRECTORY):
+        # reachability from a grid lookup instead of IK, call again after changing the working area
+        self.workspace_index = None
+        self.workspace_index = WorkspaceIndex.load_or_build(self, resolution=resolution, directory=directory)
+
+    def ik_joints(self, poses_ready):
+        # (N, 6) x, y, z, rx, ry, rz -> (N, 6) joints of the IK branch nearest the current joints, NaN when unreachable
+        reachable, near_singular, joints = self.kinematics.check(poses_ready, self.current_joints())
+        joints[~reachable] = np.nan
+        return joints
+
+    def log_rejection(self, reasons):
+        if reasons & POSE_OUTSIDE_ELLIPSE:
+            logger.error("Point X o Z is outside the boundaries of the ellipse")
+        if reasons & POSE_OUTSIDE_Y_BAND:
+            logger.error("Y axis is outside the boundary, should be fixed to %s", self.home_position[1])
+        if reasons & (POSE_PITCH_OUT_OF_RANGE | POSE_ROLL_YAW_MISMATCH):
+            logger.error("Angle is outside the boundaries for rotation")
+        if reasons & POSE_UNREACHABLE:
+            logger.error("Pose is not reachable by the arm")
+        if reasons & POSE_NEAR_SINGULAR:
+            logger.error("Pose is too close to a singularity")
+
+    def test_position(self, x, y, z):
+        reasons = self.position_reasons((x, y, z))[0]
+        self.log_rejection(reasons)
+        return reasons == POSE_VALID
 
     def test_orientation(self, r, p, y):
-        if r != self.home_orientation[0] or p < self.min_angle_rotation or p > self.max_angle_rotation or y != self.home_orientation[2]:
-            logging.error("Angle is outside the boundaries for rotation")
-            return False
-        return True
+        reasons = self.orientation_reasons((r, p, y))[0]
+        self.log_rejection(reasons)
+        return reasons == POSE_VALID
 
-    def check_point(self, pose):
-        valid_position = self.test_position(pose[0], pose[1], pose[2])
-        valid_orientation = self.test_orientation(pose[3], pose[4], pose[5])
-        if not (valid_position and valid_orientation):
-            logging.error("Not valid pose, sending robot to home position")
-            move_pose = prepare_point((self.home_position + self.home_orientation))
-            return move_pose
+    def prepare(self, pose):
+        if pose[3] == self.pitch_rotvec.roll and pose[5] == self.pitch_rotvec.yaw:
+            return tuple(pose[:3]) + self.pitch_rotvec(pose[4])
         return prepare_point(pose)
 
+    def prepare_many(self, poses):
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        pitch_only = (poses[:, 3] == self.pitch_rotvec.roll) & (poses[:, 5] == self.pitch_rotvec.yaw)
+        if not pitch_only.all():
+            return prepare_points(poses)
+        poses_ready = np.empty_like(poses)
+        poses_ready[:, :3] = poses[:, :3]
+        if poses.shape[0] == 1:
+            poses_ready[0, 3:] = self.pitch_rotvec(poses[0, 4])  # a single pose, e.g. from check_point, takes the cached scalar path
+        else:
+            poses_ready[:, 3:] = self.pitch_rotvec.batch(poses[:, 4])
+        return poses_ready
+
+    def record_command(self, pose, move_pose, measured=None):
+        # measured defaults to the newest realtime sample, NaN without a stream so stepping never waits on the robot
+        if measured is None:
+            measured = np.full(self.state_size, np.nan)
+            latest = self.state_cache.latest() if self.state_cache.running else None
+            if latest is not None:
+                measured[:6], measured[6:] = latest[1], latest[2]
+        self.recorder.record(self.clock(), pose, move_pose, measured)
+
+    def correction_distances(self, poses, corrected):
+        # meters for the position plus radians for the orientation
+        delta = corrected - poses
+        delta[:, 3:] = np.radians(delta[:, 3:])
+        return np.linalg.norm(delta, axis=1)
+
+    def project_points(self, poses, iterations=64):
+        # (N, 6) poses -> (N, 6) nearest poses inside the working area and (N,) correction distances
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        projected = poses.copy()
+
+        # x, z onto the closest point of the ellipse, the root of
+        # F(t) = (a u / (t + a^2))^2 + (b v / (t + b^2))^2 - 1 lies in [0, sqrt((a u)^2 + (b v)^2)] for points outside
+        u, v = poses[:, 0] - self.h, poses[:, 2] - self.k
+        outside = (u / self.a) ** 2 + (v / self.b) ** 2 > 1
+        au, bv = self.a * u[outside], self.b * v[outside]
+        low = np.zeros(au.shape)
+        high = np.sqrt(au ** 2 + bv ** 2)
+        for _ in range(iterations):
+            t = (low + high) / 2
+            above = (au / (t + self.a ** 2)) ** 2 + (bv / (t + self.b ** 2)) ** 2 > 1
+            low = np.where(above, t, low)
+            high = np.where(above, high, t)
+        shrink = 1 - 1e-9  # land just inside so the ellipse check does not fail on rounding
+        projected[outside, 0] = self.h + shrink * self.a * au / (high + self.a ** 2)
+        projected[outside, 2] = self.k + shrink * self.b * bv / (high + self.b ** 2)
+
+        projected[:, 1] = np.clip(poses[:, 1], self.home_position[1] - self.y_tolerance, self.home_position[1] + self.y_tolerance)
+        projected[:, 3] = self.home_orientation[0]
+        projected[:, 4] = np.clip(poses[:, 4], self.min_angle_rotation, self.max_angle_rotation)
+        projected[:, 5] = self.home_orientation[2]
+        return projected, self.correction_distances(poses, projected)
+
+    def correct_point(self, pose):
+        # -> (pose ready for movel or None when rejected, correction distance)
+        valid, reasons = self.validate_points(pose)
+        if valid[0]:
+            return self.prepare(pose), 0.0
+
+        policy = self.invalid_action_policy
+        if policy == INVALID_ACTION_PROJECT:
+            projected, distance = self.project_points(pose)
+            if self.validate_points(projected)[0][0]:
+                return self.prepare(tuple(projected[0].tolist())), float(distance[0])
+            logger.error("Projected pose is still not valid, sending robot to home position")
+            policy = INVALID_ACTION_HOME
+
+        if policy == INVALID_ACTION_REJECT:
+            return None, float(self.project_points(pose)[1][0])
+
+        home = np.array([self.home_position + self.home_orientation])
+        return self.prepare((self.home_position + self.home_orientation)), float(self.correction_distances(np.array([pose], dtype=np.float64), home)[0])
+
+    def check_point(self, pose):
+        move_pose, self.last_correction = self.correct_point(pose)
+        if self.last_correction > 0:
+            self.log_rejection(self.validate_points(pose)[1][0])
+        if self.recorder is not None:
+            self.record_command(pose, np.full(6, np.nan) if move_pose is None else move_pose)
+
+        if move_pose is None:
+            raise InvalidPoseError(f"Not valid pose {tuple(pose)}, rejected")
+        if self.invalid_action_policy == INVALID_ACTION_HOME and self.last_correction > 0:
+            logger.error("Not valid pose, sending robot to home position")
+        return move_pose
+
+
+    def sample_pose(self):
+        # one sampler row split into (x, y, z) and (roll, pitch, yaw)
+        x, y, z, roll, pitch, yaw = self.sampler.sample(1)[0].tolist()
+        return (x, y, z), (roll, pitch, yaw)
 
     def sample_position(self):
-        theta = random.uniform(0, 2 * math.pi)  # Generate random angle in radians
-        radio = math.sqrt(random.uniform(0, 1))
-        x = self.h + self.a * radio * math.cos(theta)
-        z = self.k + self.b * radio * math.sin(theta)
-        y = self.home_position[1]  # keep the Y axis fix
-        return x, y, z
+        return self.sample_pose()[0]
 
     def sample_orientation(self):
-        roll  = self.home_orientation[0]
-        pitch = random.uniform(self.min_angle_rotation, self.max_angle_rotation)
-        yaw = self.home_orientation[2]
-        return roll, pitch, yaw
+        return self.sample_pose()[1]
 
     def starting_position(self):
-        initial_position = (math.radians(90), math.radians(-90), math.radians(90), math.radians(0), math.radians(90), math.radians(0))  # Joint in rad for home position
+        initial_position = self.home_joints  # Joint in rad for home position
         self.robot.movej(initial_position, vel=0.1, acc=1.0, wait=True) # different speed for safety reasons
-        logging.info("Robot at initial position")
+        logger.info("Robot at initial position")
 
     def robot_home_position(self):
-        desire_pose = prepare_point((self.home_position + self.home_orientation))
+        desire_pose = self.prepare((self.home_position + self.home_orientation))
         self.robot.movel(desire_pose, vel=0.2, acc=1.0) # different speed for safety reasons
-        logging.info("Robot at home position")
+        logger.info("Robot at home position")
+
+    def at_pose(self, pose, target):
+        # x, y, z, rx, ry, rz poses, the rotation is compared as quaternions so equivalent rotation vectors match
+        pose = np.asarray(pose, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        q = rotvectoquat_batch(np.vstack((pose[3:], target[3:])))
+        angle = 2 * np.arccos(min(1.0, abs(float(np.dot(q[0], q[1])))))
+        return np.linalg.norm(pose[:3] - target[:3]) <= self.waypoint_tolerance and angle <= 0.01
+
+    def at_home(self):
+        return self.at_pose(self.robot.getl(), self.prepare((self.home_position + self.home_orientation)))
+
+    def robot_mode_faults(self):
+        # safety stops reported by the controller, empty when there is no secondary monitor to ask
+        secmon = getattr(self.robot, "secmon", None)
+        if secmon is None:
+            return []
+        mode = secmon.get_all_data().get("RobotModeData", {})
+        return [name for name in ("isProtectiveStopped", "isSecurityStopped", "isEmergencyStopped") if mode.get(name)]
+
+    def reset_branch(self):
+        state = self.task_sensor.read() if self.task_sensor is not None else None
+        if state == TASK_STATE_READY:
+            return RESET_SKIP
+        if state == TASK_STATE_SWINGING:
+            return RESET_DAMPING
+        return RESET_FULL
 
     def reset_task(self):
         # self.robot_home_position()
-        time.sleep(2)
-
-        # todo, can add if statement when the sensor is mounted, If ball in cup do
-        desire_orientation = (self.home_orientation[0], self.home_orientation[1] + 100, self.home_orientation[2])
-        rotate_move_pose = prepare_point((self.home_position + desire_orientation))
-        self.robot.movel(rotate_move_pose, vel=0.2, acc=1.0)
-
-        self.robot_home_position()
-
-        # this is to reduce the oscillation
-        desire_position = (self.home_position[0], self.home_position[1], self.home_position[2] - 0.66)
-        touch_ground_move_pose = prepare_point((desire_position + self.home_orientation))
-        self.robot.movel(touch_ground_move_pose, vel=0.2, acc=1.0)
-        time.sleep(2)
-
-        self.robot_home_position()
-
-
-
+        start = self.clock()
+        branch = self.reset_branch()
+
+        if branch == RESET_SKIP:
+            if not self.at_home():
+                self.robot_home_position()
+        else:
+            self.settle_detector.wait()
+
+            if branch == RESET_FULL:
+                # ball in cup, rotate to tip it out
+                desire_orientation = (self.home_orientation[0], self.home_orientation[1] + 100, self.home_orientation[2])
+                rotate_move_pose = self.prepare((self.home_position + desire_orientation))
+                self.robot.movel(rotate_move_pose, vel=0.2, acc=1.0)
+
+            self.robot_home_position()
+
+            # this is to reduce the oscillation
+            desire_position = (self.home_position[0], self.home_position[1], self.home_position[2] - 0.66)
+            touch_ground_move_pose = self.prepare((desire_position + self.home_orientation))
+            self.robot.movel(touch_ground_move_pose, vel=0.2, acc=1.0)
+            self.settle_detector.wait()
+
+            self.robot_home_position()
+
+        seconds = float(self.clock() - start)
+        self.reset_log.append((branch, seconds))
+        self.reset_counts[branch] += 1
+        self.reset_time[branch] += seconds
+        logger.info("Reset %s took %.2f s", branch, seconds)
+        return branch
 
     def get_sample_pose(self):
-        desire_position = self.sample_position()  # (x, y, z) w.r.t to the base
-        desire_orientation = self.sample_orientation() # r p y)
+        desire_position, desire_orientation = self.sample_pose()  # (x, y, z) w.r.t to the base, (r, p, y)
         desire_pose = self.check_point((desire_position + desire_orientation))
         return desire_pose
 
+    def get_sample_poses(self, n):
+        # (n, 6) poses ready for movel, sampled inside the working area so no validation is needed
+        return self.prepare_many(self.sampler.sample(n))
+
     def tool_move_pose_test(self):
         desire_tool_pose   =  self.get_sample_pose()
         self.robot.movel(desire_tool_pose, acc=self.acc, vel=self.vel)
-        logging.info("Move completed")
+        logger.debug("Move completed")
 
     def hard_code_solution(self):
 
         # pose 1
         desire_position_1 = (self.home_position[0]+0.25, self.home_position[1], self.home_position[2]+0.10)
         desire_orientation_1 = (self.home_orientation[0], self.home_orientation[1], self.home_orientation[2])
-        desire_pose_1 = self.check_point((desire_position_1 + desire_orientation_1))
-        self.robot.movel(desire_pose_1, acc=self.acc, vel=self.vel)
 
         # pose 2
         desire_position_2 = (self.home_position[0]-0.25, self.home_position[1], self.home_position[2]-0.10)
         desire_orientation_2 = (self.home_orientation[0], self.home_orientation[1]+45, self.home_orientation[2])
-        desire_pose_2 = self.check_point((desire_position_2 + desire_orientation_2))
-        self.robot.movel(desire_pose_2, acc=self.acc, vel=self.vel)
 
         # pose 3
         desire_position_3 = (self.home_position[0], self.home_position[1], self.home_position[2])
         desire_orientation_3 = (self.home_orientation[0], self.home_orientation[1]+40, self.home_orientation[2])
-        desire_pose_3 = self.check_point((desire_position_3 + desire_orientation_3))
-        self.robot.movel(desire_pose_3, acc=self.acc, vel=self.vel)
 
         # pose 4
         desire_position_4 = (self.home_position[0], self.home_position[1], self.home_position[2])
         desire_orientation_4 = (self.home_orientation[0], self.home_orientation[1], self.home_orientation[2])
-        desire_pose_4 = self.check_point((desire_position_4 + desire_orientation_4))
-        self.robot.movel(desire_pose_4, acc=self.acc, vel=self.vel)
-
-
-        #self.robot.movels([desire_pose_1, desire_pose_2, desire_pose_3], vel=self.vel, acc=self.acc, radius=0.01)
-
-
-    def get_state(self):
-        pass
-        # working here
-
-
-
-
-
 
+        waypoints = [desire_position_1 + desire_orientation_1, desire_position_2 + desire_orientation_2,
+                     desire_position_3 + desire_orientation_3, desire_position_4 + desire_orientation_4]
+
+        if self.scheduler is not None:
+            return self.scheduled_trajectory(waypoints)
+        # pose 3 and 4 only rotate the wrist, so there is nothing to blend there
+        return self.execute_trajectory(waypoints, vel=self.vel, acc=self.acc, radius=[0.01, 0.01, 0.0, 0.0])
+
+    def scheduled_trajectory(self, waypoints):
+        # execute_trajectory with the per segment speeds and blends of self.scheduler, "predicted" is its timeline
+        plan = self.scheduler.schedule(self.prepare_many(waypoints), self.current_pose(), self.current_joints())
+        return self.execute_trajectory(waypoints, vel=plan["vel"], acc=plan["acc"], radius=plan["radius"])
+
+    def blending_valid(self, lengths, radii):
+        # a blend can not be larger than half of the segments on either side of its waypoint
+        limits = 0.5 * np.minimum(lengths[:-1], lengths[1:])
+        return bool(np.all(radii[:-1] <= limits))
+
+    def program_finished(self, start, seen_running):
+        # -> finished, seen_running for a program sent at start, a program not reported running yet counts as
+        # starting until program_start_timeout
+        if self.robot.is_program_running():
+            return False, True
+        return seen_running or self.clock() - start >= self.program_start_timeout, seen_running
+
+    def wait_for_program(self, on_poll=None):
+        start = self.clock()
+        seen_running = False
+        while True:
+            finished, seen_running = self.program_finished(start, seen_running)
+            if finished:
+                return
+            if on_poll is not None:
+                on_poll()
+            self.sleep(self.poll_period)
+
+    def run_blended(self, poses_ready, vels, accs, radii, on_reached=None):
+        prog = "def trajectory():\n"
+        for pose, vel, acc, radius in zip(poses_ready, vels, accs, radii):
+            pose = ", ".join(str(round(value, 6)) for value in pose)
+            prog += f"  movel(p[{pose}], a={acc}, v={vel}, r={radius})\n"
+        prog += "end\n"
+
+        count = poses_ready.shape[0]
+        reached = [None] * count
+        next_waypoint = [0]
+
+        start = self.clock()
+
+        def track_waypoints():
+            # blended waypoints are never hit exactly, they count as reached once the TCP is inside the blend
+            position = np.array(self.robot.getl()[:3])
+            while next_waypoint[0] < count - 1:
+                distance = np.linalg.norm(position - poses_ready[next_waypoint[0], :3])
+                if distance > radii[next_waypoint[0]] + self.waypoint_tolerance:
+                    break
+                reached[next_waypoint[0]] = float(self.clock() - start)
+                if on_reached is not None:
+                    on_reached(next_waypoint[0])
+                next_waypoint[0] += 1
+
+        self.robot.send_program(prog)
+        self.wait_for_program(on_poll=track_waypoints)
+
+        # the program also ends when the controller stops it, that only counts as done at the last waypoint
+        faults = self.robot_mode_faults()
+        pose = self.robot.getl()
+        if faults or not self.at_pose(pose, poses_ready[-1]):
+            raise RobotException(f"Trajectory stopped at {np.round(pose[:3], 3).tolist()} before the last waypoint {faults}")
+        reached[-1] = float(self.clock() - start)
+        if on_reached is not None:
+            on_reached(count - 1)
+        return reached
+
+    def run_sequential(self, poses_ready, vels, accs, on_reached=None):
+        reached = []
+        start = self.clock()
+        for i, (pose, vel, acc) in enumerate(zip(poses_ready, vels, accs)):
+            self.robot.movel(tuple(pose), acc=acc, vel=vel)
+            reached.append(float(self.clock() - start))
+            if on_reached is not None:
+                on_reached(i)
+        return reached
+
+    def execute_trajectory(self, waypoints, vel=None, acc=None, radius=0.0):
+        # waypoints (N, 6) x, y, z, roll, pitch, yaw, vel, acc and radius are one value or one per waypoint
+        # returns the predicted and reached time of every waypoint in seconds from the start, None if rejected
+        waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 6)
+        count = waypoints.shape[0]
+        vels = np.broadcast_to(np.asarray(self.vel if vel is None else vel, dtype=np.float64), (count,))
+        accs = np.broadcast_to(np.asarray(self.acc if acc is None else acc, dtype=np.float64), (count,))
+        radii = np.broadcast_to(np.asarray(radius, dtype=np.float64), (count,)).copy()
+        radii[-1] = 0.0  # the trajectory has to stop at the last waypoint
+
+        valid, reasons = self.validate_points(waypoints)
+        if not valid.all():
+            first = int(np.argmax(~valid))
+            self.log_rejection(reasons[first])
+            logger.error("Waypoint %d is not valid, trajectory not executed", first)
+            return None
+
+        poses_ready = self.prepare_many(waypoints)
+        starts = np.vstack((self.current_pose(), poses_ready[:-1]))
+        if self.validate_paths:
+            valid, where, reasons = self.validate_path(poses_ready, start_pose=starts[0])
+            if not valid:
+                self.log_rejection(reasons)
+                logger.error("Path leaves the working area on segment %d at %.2f, trajectory not executed", int(where), where % 1)
+                return None
+        predicted = np.cumsum(linear_move_duration(starts, poses_ready, vels, accs))
+        lengths = np.linalg.norm(poses_ready[:, :3] - starts[:, :3], axis=1)
+
+        # with a recorder every waypoint gets a row when it is reached, with the state measured then,
+        # the ones a failed trajectory never got to are recorded with a NaN state
+        recorded = [0]
+        on_reached = None
+        if self.recorder is not None:
+            def on_reached(i):
+                self.record_command(waypoints[i], poses_ready[i], self.get_state())
+                recorded[0] = i + 1
+
+        try:
+            if self.blending_valid(lengths, radii):
+                reached = self.run_blended(poses_ready, vels, accs, radii, on_reached)
+            else:
+                logger.warning("Blend radii overlap, executing the waypoints one by one")
+                reached = self.run_sequential(poses_ready, vels, accs, on_reached)
+        except Exception:
+            if self.recorder is not None:
+                for i in range(recorded[0], count):
+                    self.record_command(waypoints[i], poses_ready[i], np.full(self.state_size, np.nan))
+            raise
+        return [{"predicted": float(p), "reached": r} for p, r in zip(predicted, reached)]
+
+    def get_state(self, history=None):
+        # joints (rad) followed by TCP pose (x, y, z, rx, ry, rz), (history, state_size) oldest first when history is given
+        if self.state_cache.running and self.state_cache.count > 0:
+            if history is None:
+                timestamp, joints, tcp = self.state_cache.latest()
+                return np.concatenate((joints, tcp))
+            timestamps, joints, tcp = self.state_cache.window(history)
+            return np.hstack((joints, tcp))
+
+        # no realtime stream, ask the robot
+        state = np.empty(self.state_size)
+        state[:6] = self.robot.getj()
+        state[6:] = self.robot.getl()
+        if history is None:
+            return state
+        return state[None]
+
+    def reset(self):
+        self.reset_task()
+        if self.recorder is not None:
+            self.recorder.start_episode()
+        return self.get_state()
+
+    def action_pose(self, action):
+        # check_point and then the path to it, the pose to send to movel or None (logged) when the arm should not move
+        try:
+            desire_pose = self.check_point(tuple(action))
+        except InvalidPoseError as e:
+            logger.error("%s", e)
+            return None
+        if self.validate_paths:
+            valid, where, reasons = self.validate_path(desire_pose)
+            if not valid:
+                self.log_rejection(reasons)
+                logger.error("Path to %s leaves the working area at %.2f, not moving", tuple(action), where)
+                return None
+        return desire_pose
 
+    def step(self, action):
+        # action is a x, y, z, roll, pitch, yaw pose, invalid ones are handled by invalid_action_policy
+        # and last_correction says how far off they were
+        desire_pose = self.action_pose(action)
+        if desire_pose is not None:
+            self.robot.movel(desire_pose, acc=self.acc, vel=self.vel)
+        return self.get_state()
+
+    def servo_control(self, mode="speedl", frequency=125.0, watchdog_timeout=0.1):
+        # continuous control instead of step(), call start() then feed set_target() from the policy loop
+        return ServoController(self, frequency=frequency, mode=mode, acc=self.acc, watchdog_timeout=watchdog_timeout)
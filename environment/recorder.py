@@ -0,0 +1,151 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+
+# columns of every recorded row
+RECORD_FIELDS = {
+    "time": 1,        # seconds on the environment clock
+    "commanded": 6,   # x, y, z, roll, pitch, yaw asked for in check_point
+    "sent": 6,        # x, y, z, rx, ry, rz pose check_point returned for movel
+    "measured": 12,   # joints + TCP from the realtime state cache, NaN when there is no stream
+}
+
+
+class EpisodeRecorder:
+    # Rows go into preallocated chunk buffers, full chunks are written to .npy files by a background thread
+    # so the control loop only pays for a row copy. Layout on disk:
+    #   index.json
+    #   episode_0000/time_0000.npy, commanded_0000.npy, ...
+    def __init__(self, directory, chunk_size=4096, num_buffers=3):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.json")
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"fields": RECORD_FIELDS, "chunk_size": chunk_size, "episodes": []}
+
+        self.free_buffers = queue.Queue()
+        for _ in range(num_buffers):
+            self.free_buffers.put({name: np.empty((chunk_size, cols)) for name, cols in RECORD_FIELDS.items()})
+        self.buffer = None
+        self.rows = 0
+
+        self.episode = None
+        self.chunks = 0
+
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.write_chunks, name="episode-recorder", daemon=True)
+        self.writer.start()
+
+    def write_chunks(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            episode_dir, chunk, buffer, rows = item
+            for name, data in buffer.items():
+                path = os.path.join(episode_dir, f"{name}_{chunk:04d}.npy")
+                out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(rows, data.shape[1]))
+                out[:] = data[:rows]
+                out.flush()
+                del out
+            self.free_buffers.put(buffer)
+            self.pending.task_done()
+
+    def episode_dir(self):
+        return os.path.join(self.directory, f"episode_{self.episode['id']:04d}")
+
+    def start_episode(self):
+        if self.episode is not None:
+            self.end_episode()
+        self.episode = {"id": len(self.index["episodes"]), "chunks": []}
+        os.makedirs(self.episode_dir(), exist_ok=True)
+        self.buffer = self.free_buffers.get()
+        self.rows = 0
+
+    def flush_chunk(self):
+        self.pending.put((self.episode_dir(), len(self.episode["chunks"]), self.buffer, self.rows))
+        self.episode["chunks"].append(self.rows)
+        self.buffer = None
+        self.rows = 0
+
+    def record(self, t, commanded, sent, measured):
+        if self.episode is None:
+            self.start_episode()
+        if self.buffer is None:
+            self.buffer = self.free_buffers.get()
+
+        i = self.rows
+        self.buffer["time"][i, 0] = t
+        self.buffer["commanded"][i] = commanded
+        self.buffer["sent"][i] = sent
+        self.buffer["measured"][i] = measured
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self.flush_chunk()
+
+    def end_episode(self):
+        if self.episode is None:
+            return
+        if self.rows > 0:
+            self.flush_chunk()
+        elif self.buffer is not None:
+            self.free_buffers.put(self.buffer)
+            self.buffer = None
+        self.pending.join()  # index only lists chunks that are on disk
+
+        self.index["episodes"].append(self.episode)
+        with open(self.index_path, "w") as f:
+            json.dump(self.index, f)
+        self.episode = None
+
+    def close(self):
+        self.end_episode()
+        self.pending.put(None)
+        self.writer.join()
+
+
+class EpisodeReader:
+    # Memory-maps recorded chunks, only the chunks a slice touches are opened
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as f:
+            self.index = json.load(f)
+        self.fields = self.index["fields"]
+
+    def __len__(self):
+        return len(self.index["episodes"])
+
+    def episode_length(self, episode):
+        return sum(self.index["episodes"][episode]["chunks"])
+
+    def chunk(self, episode, field, chunk):
+        episode_id = self.index["episodes"][episode]["id"]
+        path = os.path.join(self.directory, f"episode_{episode_id:04d}", f"{field}_{chunk:04d}.npy")
+        return np.load(path, mmap_mode="r")
+
+    def read(self, episode, field, start=0, stop=None):
+        # rows [start, stop) of one field, a view when the slice sits inside a single chunk
+        chunks = self.index["episodes"][episode]["chunks"]
+        length = sum(chunks)
+        stop = length if stop is None else min(stop, length)
+
+        parts = []
+        offset = 0
+        for chunk, rows in enumerate(chunks):
+            lo, hi = max(start, offset), min(stop, offset + rows)
+            if lo < hi:
+                parts.append(self.chunk(episode, field, chunk)[lo - offset:hi - offset])
+            offset += rows
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.empty((0, self.fields[field]))
+        return np.concatenate(parts)
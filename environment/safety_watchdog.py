@@ -0,0 +1,209 @@
+import time
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Faults the watchdog tells apart
+FAULT_PROTECTIVE_STOP = "protective_stop"  # safety limit or collision, can be unlocked after a few seconds
+FAULT_EMERGENCY_STOP = "emergency_stop"    # e-stop pressed, never recovered automatically
+FAULT_CONNECTION_LOST = "connection_lost"  # no data from the controller
+FAULT_PROGRAM_HALT = "program_halt"        # the arm stopped the running program without a safety stop
+FAULTS = (FAULT_PROTECTIVE_STOP, FAULT_EMERGENCY_STOP, FAULT_CONNECTION_LOST, FAULT_PROGRAM_HALT)
+
+# Recovery steps per fault, run in order: wait, unlock, reconnect, home. No steps means a person has to step in.
+# "unlock" clears a protective stop without anyone looking at the cell, so it is never a default, add it to the
+# recovery of a fault to opt in. By default a protective stop waits for someone to unlock it at the pendant.
+DEFAULT_RECOVERY = {
+    FAULT_PROTECTIVE_STOP: ("wait", "home"),
+    FAULT_EMERGENCY_STOP: (),
+    FAULT_CONNECTION_LOST: ("reconnect", "home"),
+    FAULT_PROGRAM_HALT: ("home",),
+}
+
+
+class DashboardClient:
+    # Minimal client for the UR dashboard server, one command per connection
+    def __init__(self, host, port=29999, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def command(self, text):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+            stream = connection.makefile("rwb")
+            stream.readline()  # welcome message
+            stream.write((text + "\n").encode())
+            stream.flush()
+            return stream.readline().decode().strip()
+
+    def unlock_protective_stop(self):
+        response = self.command("unlock protective stop")
+        self.command("close safety popup")
+        return response
+
+
+class SafetyWatchdog:
+    # Watches the robot mode in the background and recovers the cell when a move fails because of a fault.
+    # The episode loop calls handle(exception) from its except block, which classifies the fault, runs the
+    # recovery steps for it and returns True when the loop can carry on with the next episode.
+    # robot_factory builds a new connected robot for the "reconnect" step.
+    def __init__(self, env, robot_factory=None, recovery=None, period=0.1, unlock_delay=5.0, max_attempts=3,
+                 dashboard_port=29999, clock=None):
+        self.env = env
+        self.robot_factory = robot_factory
+        self.recovery = dict(DEFAULT_RECOVERY)
+        if recovery is not None:
+            self.recovery.update({fault: tuple(steps) for fault, steps in recovery.items()})
+        self.period = period
+        self.unlock_delay = unlock_delay  # the controller refuses to unlock a protective stop in the first 5 s
+        self.max_attempts = max_attempts
+        self.dashboard_port = dashboard_port
+        self.clock = clock  # defaults to the environment clock, so downtime is in virtual time on a fast-forwarded SimRobot
+        self.clock_offset = 0.0  # keeps the environment clock continuous when a reconnect brings a robot with its own clock
+
+        # last fault seen by the background thread, and when it started
+        self.fault = None
+        self.fault_start = None
+
+        self.counts = {fault: 0 for fault in FAULTS}
+        self.recovered = {fault: 0 for fault in FAULTS}
+        self.downtime = {fault: 0.0 for fault in FAULTS}  # seconds from the fault until the cell was back
+
+        self.running = False
+        self.thread = None
+
+    def read_fault(self):
+        # fault from the controller state, None when the arm is fine
+        robot = self.env.robot
+        secmon = getattr(robot, "secmon", None)
+        if secmon is None:
+            return None
+        if not getattr(secmon, "running", True):
+            return FAULT_CONNECTION_LOST
+        try:
+            mode = secmon.get_all_data().get("RobotModeData", {})
+        except Exception:
+            return FAULT_CONNECTION_LOST
+        if mode.get("isEmergencyStopped"):
+            return FAULT_EMERGENCY_STOP
+        if mode.get("isProtectiveStopped") or mode.get("isSecurityStopped"):
+            return FAULT_PROTECTIVE_STOP
+        return None
+
+    def classify(self, exception):
+        fault = self.read_fault()
+        if fault is not None:
+            return fault
+        if isinstance(exception, (ConnectionError, socket.timeout, OSError)):
+            return FAULT_CONNECTION_LOST
+        return FAULT_PROGRAM_HALT
+
+    def now(self):
+        # env.clock is looked up every time, a reconnect swaps it together with the robot
+        return self.clock() if self.clock is not None else self.env.clock() + self.clock_offset
+
+    def run(self):
+        while self.running:
+            fault = self.read_fault()
+            if fault is not None and self.fault is None:
+                self.fault_start = self.now()
+                logger.warning(f"Watchdog: {fault}")
+            self.fault = fault
+            time.sleep(self.period)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="safety-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def unlock(self):
+        robot = self.env.robot
+        if hasattr(robot, "unlock_protective_stop"):
+            robot.unlock_protective_stop()
+        else:
+            logger.info(f"Dashboard: {DashboardClient(robot.host, self.dashboard_port).unlock_protective_stop()}")
+
+    def reconnect(self):
+        if self.robot_factory is None:
+            raise RuntimeError("No robot_factory to reconnect with")
+        try:
+            self.env.robot.close()
+        except Exception as e:
+            logger.debug(f"Closing the lost connection failed: {e!r}")
+        before = self.now()
+        self.env.attach_robot(self.robot_factory())
+        if self.clock is None:
+            self.clock_offset += before - self.now()
+
+    def run_step(self, step):
+        if step == "wait":
+            self.env.sleep(self.unlock_delay)
+        elif step == "unlock":
+            self.unlock()
+        elif step == "reconnect":
+            self.reconnect()
+        elif step == "home":
+            self.env.robot_home_position()
+        else:
+            raise ValueError(f"Unknown recovery step {step}")
+
+    def recover(self, fault, start=None):
+        # every fault class met on the way is counted, e.g. a reconnect that ends in a protective stop counts both,
+        # each gets the downtime until the next one took over and all of them count as recovered when the cell is back
+        start = self.now() if start is None else start
+        seen = [fault]
+        self.counts[fault] += 1
+        recovered = False
+        for attempt in range(1, self.max_attempts + 1):
+            steps = self.recovery.get(fault, ())
+            if not steps:
+                logger.error(f"No automatic recovery for {fault}")
+                break
+            try:
+                for step in steps:
+                    logger.info(f"Recovering from {fault}: {step}")
+                    self.run_step(step)
+            except Exception as e:
+                logger.error(f"Recovery from {fault} failed (attempt {attempt}): {e!r}")
+                new_fault = self.classify(e)  # a reconnect can turn into a protective stop and so on
+                if new_fault != fault:
+                    now = self.now()
+                    self.downtime[fault] += now - start
+                    start = now
+                    fault = new_fault
+                    seen.append(fault)
+                    self.counts[fault] += 1
+                continue
+            if self.read_fault() is None:
+                recovered = True
+                break
+
+        self.downtime[fault] += self.now() - start
+        if recovered:
+            for fault in set(seen):
+                self.recovered[fault] += 1
+        return recovered
+
+    def handle(self, exception):
+        # True when the cell is back and the episode loop can carry on, False when it should give up
+        start = self.fault_start if self.fault is not None else self.now()
+        fault = self.classify(exception)
+        logger.error(f"Fault {fault}: {exception!r}")
+
+        recovered = self.recover(fault, start)
+        self.fault = None
+        return recovered
+
+    def summary(self):
+        return {fault: {"count": self.counts[fault], "recovered": self.recovered[fault], "downtime": float(self.downtime[fault])}
+                for fault in FAULTS}
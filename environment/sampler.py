@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class PoseSampler:
+    def __init__(self, center, y, a, b, orientation, min_pitch, max_pitch, seed=None, block_size=4096):
+        self.rng = np.random.default_rng(seed)  # seed can be an int or a SeedSequence spawned per worker
+        self.block_size = block_size
+
+        self.h, self.k = center  # central_point in (x, z)
+        self.y = y
+        self.a = a
+        self.b = b
+        self.roll, self.yaw = orientation
+        self.min_pitch = min_pitch
+        self.max_pitch = max_pitch
+
+        # prefetch buffer, rows are x, y, z, roll, pitch, yaw
+        self.buffer = np.empty((0, 6))
+        self.cursor = 0
+
+    def draw_block(self, n):
+        theta = self.rng.uniform(0, 2 * np.pi, n)
+        radio = np.sqrt(self.rng.uniform(0, 1, n))  # sqrt gives a uniform density over the ellipse area
+
+        block = np.empty((n, 6))
+        block[:, 0] = self.h + self.a * radio * np.cos(theta)
+        block[:, 1] = self.y  # keep the Y axis fix
+        block[:, 2] = self.k + self.b * radio * np.sin(theta)
+        block[:, 3] = self.roll
+        block[:, 4] = self.rng.uniform(self.min_pitch, self.max_pitch, n)
+        block[:, 5] = self.yaw
+        return block
+
+    def refill(self, n):
+        left = self.buffer[self.cursor:]
+        self.buffer = np.concatenate((left, self.draw_block(max(self.block_size, n - left.shape[0]))))
+        self.cursor = 0
+
+    def sample(self, n):
+        # (n, 6) x, y, z, roll, pitch, yaw poses inside the working area
+        if self.buffer.shape[0] - self.cursor < n:
+            self.refill(n)
+        poses = self.buffer[self.cursor:self.cursor + n]
+        self.cursor += n
+        return poses.copy()
@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+import numpy as np
+
+from tools.util import quat_multiply, rotvectoquat_batch, quattorotvec_batch
+from tools.kinematics import forward_kinematics, matrix_to_pose
+
+logger = logging.getLogger(__name__)
+
+SERVO_MODES = ("speedl", "speedj", "servoj")
+
+
+class ServoController:
+    # Streams the newest target to the robot from a fixed-rate loop thread.
+    #   speedl  target is a TCP velocity (vx, vy, vz, wx, wy, wz)
+    #   speedj  target is joint velocities
+    #   servoj  target is joint positions
+    # If nobody calls set_target for watchdog_timeout seconds the arm is stopped until a new target arrives.
+    # Every target goes through the environment's working area checks first, one that leaves it stops the arm instead.
+    # Runs on wall-clock time, use SimRobot(fast_forward=False) to try it without the arm.
+    def __init__(self, env, frequency=125.0, mode="speedl", acc=0.5, watchdog_timeout=0.1, jitter_window=4096):
+        if mode not in SERVO_MODES:
+            raise ValueError(f"Unknown servo mode {mode}, use one of {SERVO_MODES}")
+        self.env = env
+        self.period = 1.0 / frequency
+        self.horizon = 2 * self.period  # min_time of the speed commands, how long one runs unless replaced
+        self.mode = mode
+        self.acc = acc
+        self.watchdog_timeout = watchdog_timeout
+
+        self.target = None  # (command, time it was set), replaced as a whole so the loop never sees half an update
+        self.stopped = True  # arm is not being commanded, at start or after the watchdog fired
+        self.at_limit = False  # the current target was refused for leaving the working area
+
+        # loop statistics
+        self.ticks = 0
+        self.overruns = 0
+        self.watchdog_trips = 0
+        self.limit_stops = 0
+        self.jitter = np.zeros(jitter_window)  # seconds late per tick, ring buffer
+
+        self.running = False
+        self.thread = None
+
+    @property
+    def robot(self):
+        # looked up every time so a reconnect of the environment is picked up
+        return self.env.robot
+
+    def current_joints(self):
+        latest = self.env.state_cache.latest() if self.env.state_cache.running else None
+        if latest is None:
+            return np.asarray(self.robot.getj(), dtype=np.float64)
+        return latest[1]
+
+    def predicted_pose(self, command):
+        # x, y, z, rx, ry, rz the TCP reaches with this command, for the speed modes at the end of its min_time
+        if self.mode == "speedl":
+            pose = self.env.current_pose()
+            turn = rotvectoquat_batch(command[None, 3:] * self.horizon)[0]  # angular velocity is in the base frame
+            rotation = quat_multiply(turn, rotvectoquat_batch(pose[None, 3:])[0])
+            return np.concatenate((pose[:3] + command[:3] * self.horizon, quattorotvec_batch(np.array([rotation]))[0]))
+        if self.mode == "speedj":
+            joints = self.current_joints() + command * self.horizon
+        else:
+            joints = command
+        return matrix_to_pose(forward_kinematics(joints))[0]
+
+    def check(self, command):
+        valid, reasons = self.env.validate_points(self.env.measured_poses(self.predicted_pose(command)))
+        return bool(valid[0]), int(reasons[0])
+
+    def set_target(self, command):
+        self.target = (np.asarray(command, dtype=np.float64), time.perf_counter())
+
+    def send(self, command):
+        if self.mode == "speedl":
+            # min_time covers a couple of periods so the arm keeps moving until the next command
+            self.robot.speedl(command, self.acc, 2 * self.period)
+        elif self.mode == "speedj":
+            self.robot.speedj(command, self.acc, 2 * self.period)
+        else:
+            self.robot.servoj(command, t=self.period, lookahead_time=0.1, gain=300, wait=False)
+
+    def stop_arm(self):
+        if self.mode == "speedl":
+            self.robot.stopl(self.acc)
+        else:
+            self.robot.stopj(self.acc)
+
+    def tick(self, now):
+        target = self.target
+        if target is None or now - target[1] > self.watchdog_timeout:
+            if not self.stopped:
+                logger.warning("Servo watchdog: no new target, stopping the arm")
+                self.stop_arm()
+                self.watchdog_trips += 1
+                self.stopped = True
+            return
+        valid, reasons = self.check(target[0])
+        if not valid:
+            if not self.at_limit:
+                logger.warning("Servo target leaves the working area (reasons %d), stopping the arm", reasons)
+                self.limit_stops += 1
+                self.at_limit = True
+            if not self.stopped:
+                self.stop_arm()
+                self.stopped = True
+            return
+        self.at_limit = False
+        self.send(target[0])
+        self.stopped = False
+
+    def run(self):
+        deadline = time.perf_counter()
+        while self.running:
+            deadline += self.period
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+
+            now = time.perf_counter()
+            late = now - deadline
+            self.jitter[self.ticks % len(self.jitter)] = late
+            if late > self.period:
+                # missed at least one whole cycle, count it and start again from now instead of catching up
+                self.overruns += 1
+                deadline = now
+
+            try:
+                self.tick(now)
+            except Exception as e:
+                logger.error("Servo command failed: %s", e)
+            self.ticks += 1
+
+        if not self.stopped:
+            self.stop_arm()
+            self.stopped = True
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="servo-control", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        jitter = self.jitter[:min(self.ticks, len(self.jitter))]
+        if len(jitter) == 0:
+            jitter = np.zeros(1)
+        return {"ticks": self.ticks, "overruns": self.overruns, "watchdog_trips": self.watchdog_trips,
+                "limit_stops": self.limit_stops,
+                "jitter_mean": float(jitter.mean()), "jitter_std": float(jitter.std()),
+                "jitter_p99": float(np.percentile(jitter, 99)), "jitter_max": float(jitter.max())}
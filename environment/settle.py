@@ -0,0 +1,93 @@
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SettleDetector:
+    # Waits until TCP and joint speeds (and the oscillation signal if there is one) stay under tolerance for quiet_time.
+    # Without an oscillation signal a still arm says nothing about the ball, so it also waits at least min_dwell,
+    # the fixed pause this replaced.
+    def __init__(self, robot, clock=time.monotonic, sleep=time.sleep, linear_tolerance=0.002, joint_tolerance=0.01,
+                 oscillation=None, oscillation_tolerance=0.01, quiet_time=0.2, period=0.008, timeout=5.0,
+                 min_dwell=2.0, state_cache=None):
+        self.robot = robot
+        self.clock = clock
+        self.sleep = sleep
+        self.state_cache = state_cache  # speeds come from its newest samples while it runs, getj/getl are polled otherwise
+
+        self.linear_tolerance = linear_tolerance  # m/s
+        self.joint_tolerance = joint_tolerance  # rad/s
+        self.oscillation = oscillation  # optional callable returning the current swing amplitude of the ball
+        self.oscillation_tolerance = oscillation_tolerance
+
+        self.quiet_time = quiet_time  # longer than the state update period so repeated samples are not taken as still
+        self.period = period
+        self.timeout = timeout  # above min_dwell so an arm still moving at the end of the dwell is waited for
+        self.min_dwell = min_dwell  # seconds, only used without an oscillation signal
+
+    def sample(self):
+        return self.clock(), np.array(self.robot.getj()), np.array(self.robot.getl())
+
+    def speeds(self, last, current):
+        # (joint speed, linear speed) between two (time, joints, pose) samples, None when no time passed between them
+        dt = current[0] - last[0]
+        if dt <= 0:
+            return None
+        return np.max(np.abs(current[1] - last[1])) / dt, np.linalg.norm(current[2][:3] - last[2][:3]) / dt
+
+    def cached_speeds(self, seen):
+        # speeds from the two newest realtime samples once one newer than the first `seen` arrived,
+        # so a stalled stream is not taken as a still arm -> (speeds or None, samples seen)
+        count = self.state_cache.wait_for_newer(seen, timeout=4 * self.period)
+        if count == seen:
+            return None, count
+        times, joints, tcp = self.state_cache.window(2)
+        if len(times) < 2:
+            return None, count
+        return self.speeds((times[0], joints[0], tcp[0]), (times[1], joints[1], tcp[1])), count
+
+    def is_quiet(self, speeds):
+        joint_speed, linear_speed = speeds
+        if joint_speed > self.joint_tolerance or linear_speed > self.linear_tolerance:
+            return False
+        if self.oscillation is not None and abs(self.oscillation()) > self.oscillation_tolerance:
+            return False
+        return True
+
+    def wait(self, timeout=None):
+        # returns (settled, seconds waited)
+        timeout = self.timeout if timeout is None else timeout
+        min_dwell = self.min_dwell if self.oscillation is None else 0.0
+        cached = self.state_cache is not None and self.state_cache.running
+        start = self.clock()
+        last_time = start
+        last = None if cached else self.sample()
+        seen = self.state_cache.count if cached else 0
+        quiet_since = None
+
+        while True:
+            self.sleep(self.period)
+            now = self.clock()
+            if cached:
+                speeds, seen = self.cached_speeds(seen)
+            else:
+                current = self.sample()
+                speeds = self.speeds(last, current)
+                last = current
+
+            if speeds is None:
+                pass  # nothing new to judge by, keep the quiet streak as it is
+            elif self.is_quiet(speeds):
+                if quiet_since is None:
+                    quiet_since = last_time
+                if now - quiet_since >= self.quiet_time and now - start >= min_dwell:
+                    return True, float(now - start)
+            else:
+                quiet_since = None
+
+            if now - start >= max(timeout, min_dwell):
+                logger.warning("Robot did not settle before the timeout")
+                return False, float(now - start)
+            last_time = now
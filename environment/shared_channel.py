@@ -0,0 +1,165 @@
+import sys
+import time
+import logging
+import collections
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+from environment.main_environment_ur5 import Environment
+
+logger = logging.getLogger(__name__)
+
+ACTION_SIZE = 6  # x, y, z, roll, pitch, yaw
+
+# seq of the record, seq of the record on the other side it answers (0 for none), time.monotonic() when written, values
+Record = collections.namedtuple("Record", "seq ref time values")
+
+
+class SharedRing:
+    # One direction of a SharedChannel, a single writer and a single reader, no locks.
+    # Records go round `slots` fixed size slots, every slot carries the sequence number of the record in it,
+    # 0 while it is being written, so a reader that was overtaken by the writer can tell (seqlock style).
+    def __init__(self, buffer, offset, size, slots):
+        self.size = size
+        self.slots = slots
+
+        def view(dtype, shape):
+            nonlocal offset
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.latest_seq = view(np.int64, (1,))  # last published record
+        self.slot_seq = view(np.int64, (slots,))
+        self.slot_ref = view(np.int64, (slots,))
+        self.slot_time = view(np.float64, (slots,))
+        self.values = view(np.float64, (slots, size))
+        self.end = offset
+
+        self.written = int(self.latest_seq[0])  # writer side
+        self.taken = 0  # reader side, newest seq handed out by take_newest
+
+    @staticmethod
+    def nbytes(size, slots):
+        return 8 * (1 + 3 * slots + slots * size)
+
+    def write(self, values, ref=0):
+        seq = self.written + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = 0  # readers of this slot retry until it is published again
+        self.values[slot] = values
+        self.slot_ref[slot] = ref
+        self.slot_time[slot] = time.monotonic()
+        self.slot_seq[slot] = seq
+        self.latest_seq[0] = seq
+        self.written = seq
+        return seq
+
+    def latest(self, copy=True, retries=8):
+        # newest record or None, with copy=False values is a view into shared memory,
+        # check still_valid(record) after using it, the writer reuses the slot `slots` records later
+        for _ in range(retries):
+            seq = int(self.latest_seq[0])
+            if seq == 0:
+                return None
+            slot = seq % self.slots
+            values = self.values[slot].copy() if copy else self.values[slot]
+            record = Record(seq, int(self.slot_ref[slot]), float(self.slot_time[slot]), values)
+            if self.slot_seq[slot] == seq:
+                return record
+        return None
+
+    def still_valid(self, record):
+        return self.slot_seq[record.seq % self.slots] == record.seq
+
+    def take_newest(self, copy=True):
+        # newest record not handed out before, None right away when there is nothing new
+        record = self.latest(copy)
+        if record is None or record.seq <= self.taken:
+            return None
+        self.taken = record.seq
+        return record
+
+    def wait_newest(self, timeout=None, poll_period=0.0005, copy=True):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            record = self.take_newest(copy)
+            if record is not None:
+                return record
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_period)
+
+    def age(self, record):
+        # seconds since the record was written, time.monotonic() is shared by every process on the machine
+        return time.monotonic() - record.time
+
+    def is_stale(self, record, max_age=None, max_lag=None):
+        # stale when older than max_age seconds or when max_lag newer records were written since
+        if record is None:
+            return True
+        if max_age is not None and self.age(record) > max_age:
+            return True
+        return max_lag is not None and int(self.latest_seq[0]) - record.seq > max_lag
+
+
+class SharedChannel:
+    # Observations from the control loop to a learner process and actions back, over one shared memory block.
+    # The control loop side creates it, the learner attaches by name:
+    #   channel = SharedChannel()                      channel = SharedChannel(name)
+    #   serve(env, channel)                            record = channel.observations.wait_newest()
+    #                                                  channel.actions.write(action, ref=record.seq)
+    def __init__(self, name=None, state_size=Environment.state_size, action_size=ACTION_SIZE, slots=4):
+        create = name is None
+        size = 8 + SharedRing.nbytes(state_size, slots) + SharedRing.nbytes(action_size, slots)
+        if create:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        elif sys.version_info >= (3, 13):
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # attaching registers the block with this process's resource tracker, which would unlink it when
+            # the learner exits, only the creating side owns it
+            self.memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.name = self.memory.name
+        self.owner = create
+
+        self.flags = np.ndarray((1,), dtype=np.int64, buffer=self.memory.buf)  # 1 once either side closed it
+        if create:
+            self.memory.buf[:size] = bytes(size)
+        self.observations = SharedRing(self.memory.buf, 8, state_size, slots)
+        self.actions = SharedRing(self.memory.buf, self.observations.end, action_size, slots)
+
+    @property
+    def closed(self):
+        return bool(self.flags[0])
+
+    def close(self):
+        self.flags[0] = 1
+        del self.flags
+        self.observations = self.actions = None
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                logger.warning("Shared memory %s was already removed", self.name)
+
+
+def serve(env, channel, max_age=0.1, poll_period=0.0005):
+    # Control loop side: publishes the state, then steps the newest action as it arrives until the channel is closed.
+    # Actions older than max_age seconds are dropped rather than sent to the arm. Returns (steps, stale actions).
+    channel.observations.write(env.get_state())
+    steps = stale = 0
+    while not channel.closed:
+        record = channel.actions.take_newest()
+        if record is None:
+            time.sleep(poll_period)
+            continue
+        if channel.actions.is_stale(record, max_age=max_age):
+            stale += 1
+            logger.warning("Dropping action %d, %.3f s old", record.seq, channel.actions.age(record))
+            continue
+        channel.observations.write(env.step(record.values), ref=record.seq)
+        steps += 1
+    return steps, stale
@@ -0,0 +1,304 @@
+import re
+import math
+import time
+import logging
+import numpy as np
+
+from tools.util import trapezoid_duration, linear_move_duration
+from environment.safety_watchdog import FAULT_PROTECTIVE_STOP, FAULT_EMERGENCY_STOP, FAULT_CONNECTION_LOST, FAULT_PROGRAM_HALT
+
+logger = logging.getLogger(__name__)
+
+MOVEL_PATTERN = re.compile(r"movel\(p\[([^\]]*)\],\s*a=([^,]+),\s*v=([^,]+),\s*r=([^)]+)\)")
+
+
+class RobotException(Exception):
+    # same role as urx.urrobot.RobotException, raised when a move ends because the arm stopped
+    pass
+
+
+class SimRealtimeMonitor:
+    # Stand-in for urx's realtime monitor, hands out a sample every controller cycle of wall-clock time
+    def __init__(self, robot, period=0.008):
+        self.robot = robot
+        self.period = period
+
+    def get_all_data(self, wait=True):
+        if wait:
+            time.sleep(self.period)
+        return dict(timestamp=self.robot.clock(), qActual=self.robot.current_joints(), qTarget=self.robot.key_joints[-1].copy(),
+                    tcp=self.robot.current_pose(), tcp_force=np.zeros(6))
+
+
+class SimSecondaryMonitor:
+    # Stand-in for urx's secondary monitor, only the JointData and MasterBoardData values TelemetryPoller reads.
+    # Motor temperatures can be set on the robot to try the alerts.
+    def __init__(self, robot):
+        self.robot = robot
+
+    @property
+    def running(self):
+        return self.robot.fault != FAULT_CONNECTION_LOST
+
+    def get_all_data(self, wait=False):
+        self.robot.update_fault()
+        if self.robot.fault == FAULT_CONNECTION_LOST:
+            raise ConnectionError("Lost connection to the simulated robot")
+        joint_data = {}
+        joints = self.robot.current_joints()
+        for j in range(6):
+            joint_data[f"q_actual{j}"] = float(joints[j])
+            joint_data[f"T_motor{j}"] = float(self.robot.motor_temperatures[j])
+            joint_data[f"V_actual{j}"] = 47.5
+            joint_data[f"I_actual{j}"] = 0.5 if self.robot.clock() < self.robot.motion_end else 0.1
+        board_data = {"robotVoltage48V": 47.8, "robotCurrent": 1.2, "masterBoardTemperature": 35.0}
+        mode_data = {"isProtectiveStopped": self.robot.fault == FAULT_PROTECTIVE_STOP, "isEmergencyStopped": self.robot.fault == FAULT_EMERGENCY_STOP,
+                     "isProgramRunning": self.robot.clock() < self.robot.motion_end}
+        return {"JointData": joint_data, "MasterBoardData": board_data, "RobotModeData": mode_data}
+
+
+class SimRobot:
+    # Stand-in for urx.Robot with the subset of the API used by Environment and train.py.
+    # Moves take as long as a trapezoidal velocity profile says, fast_forward advances a virtual clock instead of sleeping.
+    def __init__(self, initial_joints=None, initial_pose=None, fast_forward=True, command_latency=0.0, use_rt=False, record_commands=False):
+        if initial_joints is None:
+            initial_joints = (math.radians(90), math.radians(-90), math.radians(90), math.radians(0), math.radians(90), math.radians(0))
+        if initial_pose is None:
+            initial_pose = (0.14, -0.50, 0.40, math.pi / 2, 0.0, 0.0)
+
+        self.host = "sim"
+        self.fast_forward = fast_forward
+        self.command_latency = command_latency  # seconds added to every command, stands in for the network round-trip
+        self.poll_step = 0.008  # virtual time that passes on every status poll in fast_forward, one controller cycle
+
+        self.virtual_time = 0.0
+        self.start_time = time.monotonic()
+
+        self.tcp = (0, 0, 0, 0, 0, 0)
+        self.payload = (0.0, (0, 0, 0))
+
+        # current motion as key frames, pose and joints are interpolated between them while it runs
+        # there is no kinematic model, movel only moves the pose and movej only moves the joints
+        self.key_times = np.zeros(1)
+        self.key_poses = np.array([initial_pose], dtype=np.float64)
+        self.key_joints = np.array([initial_joints], dtype=np.float64)
+        self.motion_end = 0.0
+
+        self.rtmon = SimRealtimeMonitor(self) if use_rt else None
+        self.secmon = SimSecondaryMonitor(self)
+        self.motor_temperatures = np.full(6, 30.0)
+
+        # fault injection, see inject_fault
+        self.fault = None  # active fault, one of the FAULT_* values
+        self.pending_fault = None
+        self.fault_at = None
+
+        # (time, command, arguments) of every motion command, when record_commands is set
+        self.record_commands = record_commands
+        self.commands = []
+
+    def clock(self):
+        if self.fast_forward:
+            return self.virtual_time
+        return time.monotonic() - self.start_time
+
+    def sleep_until(self, t):
+        if self.fast_forward:
+            self.virtual_time = max(self.virtual_time, t)
+        else:
+            remaining = t - self.clock()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def sleep(self, seconds):
+        self.sleep_until(self.clock() + seconds)
+
+    def interpolate(self, keys):
+        now = self.clock()
+        if now >= self.key_times[-1]:
+            return keys[-1].copy()
+        if now <= self.key_times[0]:
+            return keys[0].copy()
+        i = np.searchsorted(self.key_times, now)  # key_times[i - 1] < now <= key_times[i]
+        s = (now - self.key_times[i - 1]) / (self.key_times[i] - self.key_times[i - 1])
+        return keys[i - 1] + s * (keys[i] - keys[i - 1])
+
+    def current_pose(self):
+        return self.interpolate(self.key_poses)
+
+    def current_joints(self):
+        return self.interpolate(self.key_joints)
+
+    def log_command(self, name, *args):
+        if self.record_commands:
+            self.commands.append((self.clock(), name, args))
+
+    def start_motion(self, durations, target_poses=None, target_joints=None):
+        now = self.clock() + self.command_latency
+        start_pose = self.current_pose()
+        start_joints = self.current_joints()
+        count = len(durations)
+
+        self.key_times = now + np.concatenate(([0.0], np.cumsum(durations)))
+        if target_poses is None:
+            self.key_poses = np.repeat(start_pose[None], count + 1, axis=0)
+        else:
+            self.key_poses = np.vstack((start_pose, np.asarray(target_poses, dtype=np.float64).reshape(count, 6)))
+        if target_joints is None:
+            self.key_joints = np.repeat(start_joints[None], count + 1, axis=0)
+        else:
+            self.key_joints = np.vstack((start_joints, np.asarray(target_joints, dtype=np.float64).reshape(count, 6)))
+        self.motion_end = self.key_times[-1]
+
+    def joint_duration(self, start_joints, target_joints, acc, vel):
+        # the leading joint sets the time, the others are synchronised to it
+        return float(np.max(trapezoid_duration(np.asarray(target_joints) - start_joints, vel, acc)))
+
+    def set_tcp(self, tcp):
+        self.tcp = tuple(tcp)
+
+    def set_payload(self, weight, cog=None):
+        self.payload = (weight, cog)
+
+    def inject_fault(self, fault, delay=0.0):
+        # the fault happens delay seconds from now, a move running then stops where it is and raises
+        self.pending_fault = fault
+        self.fault_at = self.clock() + delay
+
+    def update_fault(self):
+        if self.pending_fault is not None and self.clock() >= self.fault_at:
+            self.fault = self.pending_fault
+            self.pending_fault = self.fault_at = None
+            self.start_motion([])
+            logger.debug("Injected fault %s", self.fault)
+
+    def check_connection(self):
+        self.update_fault()
+        if self.fault == FAULT_CONNECTION_LOST:
+            raise ConnectionError("Lost connection to the simulated robot")
+
+    def check_fault(self):
+        self.check_connection()
+        if self.fault in (FAULT_PROTECTIVE_STOP, FAULT_EMERGENCY_STOP):
+            raise RobotException(f"Robot stopped: {self.fault}")
+        if self.fault == FAULT_PROGRAM_HALT:
+            self.fault = None  # only the running program is lost
+            raise RobotException("Robot stopped: program halted")
+
+    def wait_motion(self):
+        end = self.motion_end
+        if self.fault_at is not None and self.fault_at < end:
+            end = self.fault_at
+        self.sleep_until(end)
+        self.check_fault()
+
+    def unlock_protective_stop(self):
+        # what the dashboard server "unlock protective stop" does, an emergency stop needs a person
+        if self.fault == FAULT_PROTECTIVE_STOP:
+            self.fault = None
+
+    def get_main_voltage(self):
+        self.check_connection()
+        return 48.1
+
+    def is_program_running(self):
+        if self.fast_forward:
+            self.virtual_time += self.poll_step
+        self.check_connection()
+        return self.clock() < self.motion_end
+
+    def movel(self, tpose, acc=0.01, vel=0.01, wait=True, relative=False, threshold=None):
+        self.log_command("movel", tpose, acc, vel)
+        self.check_fault()
+        start_pose = self.current_pose()
+        target_pose = np.array(tpose, dtype=np.float64)
+        if relative:
+            target_pose = start_pose + target_pose
+        self.start_motion([float(linear_move_duration(start_pose, target_pose, vel, acc))], target_poses=target_pose)
+        if wait:
+            self.wait_motion()
+            return self.getl()
+
+    def movej(self, joints, acc=0.1, vel=0.05, wait=True, relative=False, threshold=None):
+        self.log_command("movej", joints, acc, vel)
+        self.check_fault()
+        start_joints = self.current_joints()
+        target_joints = np.array(joints, dtype=np.float64)
+        if relative:
+            target_joints = start_joints + target_joints
+        self.start_motion([self.joint_duration(start_joints, target_joints, acc, vel)], target_joints=target_joints)
+        if wait:
+            self.wait_motion()
+            return self.getj()
+
+    def run_linear_path(self, poses, accs, vels, wait):
+        # blending is not modelled, the segments are timed back to back
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        starts = np.vstack((self.current_pose(), poses[:-1]))
+        self.start_motion(linear_move_duration(starts, poses, np.asarray(vels), np.asarray(accs)), target_poses=poses)
+        if wait:
+            self.wait_motion()
+            return self.getl()
+
+    def movels(self, pose_list, acc=0.01, vel=0.01, radius=0.01, wait=True, threshold=None):
+        self.log_command("movels", pose_list, acc, vel, radius)
+        self.check_fault()
+        return self.run_linear_path(pose_list, acc, vel, wait)
+
+    def send_program(self, prog):
+        self.log_command("send_program", prog)
+        self.check_fault()
+        # only understands the movel(p[...], a=, v=, r=) lines that Environment generates
+        moves = MOVEL_PATTERN.findall(prog)
+        poses = [[float(value) for value in pose.split(",")] for pose, a, v, r in moves]
+        accs = [float(a) for pose, a, v, r in moves]
+        vels = [float(v) for pose, a, v, r in moves]
+        self.run_linear_path(poses, accs, vels, wait=False)
+
+    def speedl(self, velocities, acc, min_time):
+        self.log_command("speedl", velocities, acc, min_time)
+        self.check_fault()
+        # constant tool speed for min_time, acceleration is not modelled
+        target_pose = self.current_pose() + np.asarray(velocities, dtype=np.float64) * min_time
+        self.start_motion([min_time], target_poses=target_pose)
+
+    def speedj(self, velocities, acc, min_time):
+        self.log_command("speedj", velocities, acc, min_time)
+        self.check_fault()
+        target_joints = self.current_joints() + np.asarray(velocities, dtype=np.float64) * min_time
+        self.start_motion([min_time], target_joints=target_joints)
+
+    def servoj(self, tjoints, acc=0.01, vel=0.01, t=0.1, lookahead_time=0.2, gain=100, wait=True, relative=False, threshold=None):
+        self.log_command("servoj", tjoints, t)
+        self.check_fault()
+        target_joints = np.array(tjoints, dtype=np.float64)
+        if relative:
+            target_joints = self.current_joints() + target_joints
+        self.start_motion([t], target_joints=target_joints)
+        if wait:
+            self.wait_motion()
+
+    def stopl(self, acc=0.5):
+        self.log_command("stopl", acc)
+        # stops where it is, the deceleration ramp is not modelled
+        self.start_motion([])
+
+    def stopj(self, acc=1.5):
+        self.log_command("stopj", acc)
+        self.start_motion([])
+
+    def getl(self, wait=False, _log=True):
+        self.check_connection()
+        self.sleep_until(self.clock() + self.command_latency)
+        pose = self.current_pose().tolist()
+        if _log:
+            logger.debug("Returning pose to user: %s", pose)
+        return pose
+
+    def getj(self, wait=False):
+        self.check_connection()
+        self.sleep_until(self.clock() + self.command_latency)
+        return self.current_joints().tolist()
+
+    def close(self):
+        pass
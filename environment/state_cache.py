@@ -0,0 +1,74 @@
+import time
+import logging
+import threading
+import numpy as np
+
+from tools.ring_buffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class RealtimeStateCache:
+    # Background thread that keeps the latest joint and TCP samples from the robot in a preallocated ring buffer.
+    # With urx.Robot(..., use_rt=True) it reads the realtime monitor at the controller rate (125 Hz),
+    # otherwise it falls back to polling getj/getl every period seconds.
+    def __init__(self, robot, capacity=1024, period=0.008):
+        self.robot = robot
+        self.capacity = capacity
+        self.period = period
+
+        self.buffer = RingBuffer(capacity, {"joints": (6, np.float64), "tcp": (6, np.float64)})
+        self.running = False
+        self.thread = None
+
+    def read_sample(self):
+        rtmon = getattr(self.robot, "rtmon", None)
+        if rtmon is not None:
+            data = rtmon.get_all_data(wait=True)  # blocks until the next realtime packet
+            return data["timestamp"], data["qActual"], data["tcp"]
+        time.sleep(self.period)
+        return time.monotonic(), self.robot.getj(), self.robot.getl()
+
+    def run(self):
+        while self.running:
+            try:
+                timestamp, joints, tcp = self.read_sample()
+            except Exception as e:
+                logger.error(f"Realtime state stream failed: {e}")
+                time.sleep(self.period)
+                continue
+
+            self.buffer.push(timestamp, joints, tcp)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="realtime-state", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    @property
+    def count(self):
+        # total samples written
+        return self.buffer.count
+
+    def wait_for_sample(self, timeout=1.0):
+        return self.buffer.wait_for_newer(0, timeout) > 0
+
+    def wait_for_newer(self, count, timeout=1.0):
+        # blocks until more than count samples were written, returns the new total
+        return self.buffer.wait_for_newer(count, timeout)
+
+    def latest(self):
+        # (timestamp, joints, tcp) of the newest sample
+        return self.buffer.latest()
+
+    def window(self, n):
+        # the newest n samples, oldest first, as (timestamps, joints, tcp) arrays
+        return self.buffer.window(n)
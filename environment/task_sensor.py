@@ -0,0 +1,41 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What the sensor says about the ball
+TASK_STATE_UNKNOWN = "unknown"    # no reading, reset_task assumes the worst
+TASK_STATE_READY = "ready"        # ball hanging still below the cup, the start state of an episode
+TASK_STATE_SWINGING = "swinging"  # ball out of the cup but still swinging
+TASK_STATE_IN_CUP = "in_cup"      # ball in the cup, it has to be tipped out
+
+TASK_STATES = (TASK_STATE_UNKNOWN, TASK_STATE_READY, TASK_STATE_SWINGING, TASK_STATE_IN_CUP)
+
+
+class TaskSensor:
+    # Interface for whatever ends up mounted on the cup, read() returns one of the TASK_STATE_* values
+    def read(self):
+        return TASK_STATE_UNKNOWN
+
+
+class ReplayTaskSensor(TaskSensor):
+    # Plays back recorded readings, one state per line in a text file or a list, to run reset_task without the sensor
+    def __init__(self, states=None, path=None, loop=True):
+        if path is not None:
+            with open(path) as f:
+                states = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        self.states = list(states or [])
+        for state in self.states:
+            if state not in TASK_STATES:
+                raise ValueError(f"Unknown task state {state}, use one of {TASK_STATES}")
+        self.loop = loop
+        self.position = 0
+
+    def read(self):
+        if self.position >= len(self.states):
+            if not self.loop or not self.states:
+                return TASK_STATE_UNKNOWN
+            self.position = 0
+        state = self.states[self.position]
+        self.position += 1
+        logger.debug("Replayed task state %s", state)
+        return state
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+import collections
+import numpy as np
+
+from tools.ring_buffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+# Columns of a telemetry row, read from one secondary monitor packet except mainVoltage
+JOINT_FIELDS = ("T_motor", "V_actual", "I_actual")  # per joint, JointData<field><joint>
+BOARD_FIELDS = ("robotVoltage48V", "robotCurrent", "masterBoardTemperature")  # MasterBoardData, robotVoltage48V is the arm supply
+MAIN_VOLTAGE = "mainVoltage"  # not in the secondary packet, the robot's get_main_voltage() reads it from the realtime one
+COLUMNS = tuple(f"{field}{j}" for field in JOINT_FIELDS for j in range(6)) + BOARD_FIELDS + (MAIN_VOLTAGE,)
+
+DEFAULT_THRESHOLDS = {"T_motor": 65.0}  # deg C, a field name covers all six joints
+
+
+def parse_snapshot(data, row):
+    # fills row (len(COLUMNS),) from secmon.get_all_data(), missing values are left as nan
+    row[:] = np.nan
+    joints = data.get("JointData", {})
+    board = data.get("MasterBoardData", {})
+    for i, name in enumerate(COLUMNS):
+        source = board if name in BOARD_FIELDS else joints
+        value = source.get(name)
+        if value is not None:
+            row[i] = value
+
+
+def read_snapshot(robot, row):
+    # the whole row, the secondary packet plus the main voltage when the robot can report it
+    parse_snapshot(robot.secmon.get_all_data(), row)
+    if hasattr(robot, "get_main_voltage"):
+        row[COLUMNS.index(MAIN_VOLTAGE)] = robot.get_main_voltage()
+
+
+class TelemetryPoller:
+    # Background thread that takes the whole joint and board snapshot from the secondary monitor at rate Hz
+    # and keeps it in a preallocated ring buffer, instead of one blocking getter per value.
+    # thresholds maps a column or field name to its upper limit, an alert fires when a value goes above it.
+    def __init__(self, robot, rate=10.0, capacity=4096, thresholds=None, on_alert=None):
+        self.robot = robot
+        self.period = 1.0 / rate
+        self.capacity = capacity
+        self.on_alert = on_alert
+
+        self.buffer = RingBuffer(capacity, {"rows": (len(COLUMNS), np.float32)})
+
+        self.limits = np.full(len(COLUMNS), np.inf, dtype=np.float32)
+        for name, limit in (DEFAULT_THRESHOLDS if thresholds is None else thresholds).items():
+            for i, column in enumerate(COLUMNS):
+                if column == name or (name in JOINT_FIELDS and column.startswith(name)):
+                    self.limits[i] = limit
+        self.alerting = np.zeros(len(COLUMNS), dtype=bool)  # columns above their limit, so each crossing is reported once
+        self.alerts = collections.deque(maxlen=256)  # (timestamp, column, value)
+
+        self.running = False
+        self.thread = None
+
+    def read_snapshot(self, row):
+        read_snapshot(self.robot, row)
+
+    def check_alerts(self, timestamp, row):
+        above = row > self.limits  # nan compares False
+        for i in np.flatnonzero(above & ~self.alerting):
+            alert = (timestamp, COLUMNS[i], float(row[i]))
+            self.alerts.append(alert)
+            logger.warning(f"Telemetry alert: {COLUMNS[i]} = {row[i]:.2f} above {self.limits[i]:.2f}")
+            if self.on_alert is not None:
+                self.on_alert(*alert)
+        self.alerting = above
+
+    def run(self):
+        row = np.empty(len(COLUMNS), dtype=np.float32)
+        deadline = time.monotonic()
+        while self.running:
+            timestamp = time.monotonic()
+            try:
+                self.read_snapshot(row)
+            except Exception as e:
+                logger.error(f"Telemetry read failed: {e}")
+            else:
+                self.buffer.push(timestamp, row)
+                self.check_alerts(timestamp, row)
+
+            deadline += self.period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                deadline = time.monotonic()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    @property
+    def count(self):
+        # total snapshots written
+        return self.buffer.count
+
+    def latest(self):
+        # {column: value} of the newest snapshot plus its "timestamp"
+        latest = self.buffer.latest()
+        if latest is None:
+            return None
+        timestamp, row = latest
+        snapshot = dict(zip(COLUMNS, row.tolist()))
+        snapshot["timestamp"] = timestamp
+        return snapshot
+
+    def window(self, n):
+        # the newest n snapshots, oldest first, as (timestamps, rows) with rows in COLUMNS order
+        return self.buffer.window(n)
@@ -0,0 +1,163 @@
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+from environment.main_environment_ur5 import Environment
+
+ACTION_SIZE = 6  # x, y, z, roll, pitch, yaw
+
+
+def worker(index, env_fn, pipe, memory_names, num_envs, max_episode_steps):
+    # every worker writes its own row of the shared buffers, only small commands go through the pipe
+    # every command is answered with ("ok", value) or ("error", traceback), a failing env does not end the worker
+    memories = [shared_memory.SharedMemory(name=name) for name in memory_names]
+    observations = np.ndarray((num_envs, Environment.state_size), dtype=np.float64, buffer=memories[0].buf)
+    final_observations = np.ndarray((num_envs, Environment.state_size), dtype=np.float64, buffer=memories[1].buf)
+    actions = np.ndarray((num_envs, ACTION_SIZE), dtype=np.float64, buffer=memories[2].buf)
+
+    env = None
+    error = None
+    try:
+        env = env_fn()
+    except Exception:
+        error = traceback.format_exc()  # reported for every command until close
+
+    steps = 0
+    try:
+        while True:
+            try:
+                command = pipe.recv()
+            except EOFError:
+                break  # the parent is gone
+            if command == "close":
+                break
+            if env is None:
+                pipe.send(("error", error))
+                continue
+            try:
+                if command == "step":
+                    observations[index] = env.step(actions[index])
+                    steps += 1
+                    done = steps >= max_episode_steps
+                    if done:  # auto reset, the last observation of the episode is kept in final_observations
+                        final_observations[index] = observations[index]
+                        observations[index] = env.reset()
+                        steps = 0
+                    pipe.send(("ok", done))
+                elif command == "reset":
+                    observations[index] = env.reset()
+                    steps = 0
+                    pipe.send(("ok", True))
+            except Exception:
+                pipe.send(("error", traceback.format_exc()))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        if env is not None:
+            try:
+                env.robot.close()
+            except Exception:
+                pass
+        del observations, final_observations, actions
+        for memory in memories:
+            memory.close()
+        pipe.close()
+
+
+class VectorEnvironment:
+    # Runs one Environment per process, env_fns are picklable callables that build the Environment inside the worker.
+    # An exception in a worker is raised here as a RuntimeError with the worker's traceback, after every worker answered.
+    def __init__(self, env_fns, max_episode_steps=10, start_method=None):
+        self.num_envs = len(env_fns)
+        ctx = mp.get_context(start_method)
+
+        state_bytes = self.num_envs * Environment.state_size * 8
+        self.memories = []
+        self.pipes = []
+        self.processes = []
+        self.closed = False
+        try:
+            for size in (state_bytes, state_bytes, self.num_envs * ACTION_SIZE * 8):
+                self.memories.append(shared_memory.SharedMemory(create=True, size=size))
+            self.observations = np.ndarray((self.num_envs, Environment.state_size), dtype=np.float64, buffer=self.memories[0].buf)
+            self.final_observations = np.ndarray((self.num_envs, Environment.state_size), dtype=np.float64, buffer=self.memories[1].buf)
+            self.actions = np.ndarray((self.num_envs, ACTION_SIZE), dtype=np.float64, buffer=self.memories[2].buf)
+
+            memory_names = [memory.name for memory in self.memories]
+            for index, env_fn in enumerate(env_fns):
+                parent_pipe, child_pipe = ctx.Pipe()
+                process = ctx.Process(target=worker, args=(index, env_fn, child_pipe, memory_names, self.num_envs, max_episode_steps), daemon=True)
+                process.start()
+                child_pipe.close()
+                self.pipes.append(parent_pipe)
+                self.processes.append(process)
+        except BaseException:
+            self.close()
+            raise
+
+    def call(self, command):
+        # sends the command to every worker and waits for every answer, so the pipes stay in step even when some fail,
+        # then raises one RuntimeError listing the failures
+        results = [None] * self.num_envs
+        errors = []
+        sent = []
+        for index, pipe in enumerate(self.pipes):
+            try:
+                pipe.send(command)
+                sent.append(index)
+            except (BrokenPipeError, OSError):
+                errors.append(f"Environment {index} failed: worker exited with code {self.processes[index].exitcode}")
+        for index in sent:
+            try:
+                status, value = self.pipes[index].recv()
+            except (EOFError, ConnectionResetError, BrokenPipeError):
+                self.processes[index].join(1.0)
+                status, value = "error", f"worker exited with code {self.processes[index].exitcode}"
+            if status == "error":
+                errors.append(f"Environment {index} failed: {value}")
+            results[index] = value
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return results
+
+    def reset(self):
+        self.call("reset")
+        return self.observations.copy()
+
+    def step(self, actions):
+        # actions (num_envs, 6) -> observations (num_envs, state_size), dones (num_envs,)
+        self.actions[:] = actions
+        dones = np.array(self.call("step"))
+        return self.observations.copy(), dones
+
+    def close(self, timeout=5.0):
+        # safe to call with dead workers and more than once, the shared memory is always released
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            for pipe in self.pipes:
+                try:
+                    pipe.send("close")
+                except (BrokenPipeError, OSError):
+                    pass
+            for process in self.processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            for pipe in self.pipes:
+                pipe.close()
+        finally:
+            for name in ("observations", "final_observations", "actions"):
+                self.__dict__.pop(name, None)
+            for memory in self.memories:
+                memory.close()
+                memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
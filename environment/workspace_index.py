@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache')
+
+
+class WorkspaceIndex:
+    # Precomputed grid over (x, z, pitch) of the working area, y, roll and yaw are fixed to home.
+    # Every cell keeps
+    #   valid      the whole x-z cell is inside the ellipse
+    #   kinematic  POSE_UNREACHABLE / POSE_NEAR_SINGULAR flags of the cell centre, 0 when reachable,
+    #              on the IK branch nearest the home joints so the grid does not depend on where the arm was at build time
+    #   clearance  meters from the cell centre to the ellipse boundary, negative outside
+    def __init__(self, params, valid, kinematic, clearance):
+        self.params = params
+        self.valid = valid
+        self.kinematic = kinematic
+        self.clearance = clearance
+
+        self.origin = np.array([params["x_min"], params["z_min"], params["pitch_min"]])
+        self.step = np.array(params["resolution"])
+        self.shape = np.array(valid.shape)
+
+    @staticmethod
+    def parameters(env, resolution):
+        params = {"h": env.h, "k": env.k, "a": env.a, "b": env.b,
+                  "y": env.home_position[1], "y_tolerance": env.y_tolerance, "roll": env.home_orientation[0], "yaw": env.home_orientation[2],
+                  "pitch_min": env.min_angle_rotation, "pitch_max": env.max_angle_rotation,
+                  "x_min": env.h - env.a, "z_min": env.k - env.b, "resolution": list(resolution)}
+        if env.kinematics is not None:
+            params["margins"] = [env.kinematics.wrist_margin, env.kinematics.elbow_margin, env.kinematics.shoulder_margin]
+            params["reference_joints"] = [float(joint) for joint in env.home_joints]
+        return params
+
+    @classmethod
+    def build(cls, env, resolution=(0.01, 0.01, 2.0)):
+        params = cls.parameters(env, resolution)
+        dx, dz, dp = resolution
+        nx = int(np.ceil(2 * env.a / dx))
+        nz = int(np.ceil(2 * env.b / dz))
+        npitch = int(np.ceil((env.max_angle_rotation - env.min_angle_rotation) / dp)) + 1
+
+        x_edges = params["x_min"] + dx * np.arange(nx + 1)
+        z_edges = params["z_min"] + dz * np.arange(nz + 1)
+        x_centres = x_edges[:-1] + dx / 2
+        z_centres = z_edges[:-1] + dz / 2
+        pitches = np.minimum(env.min_angle_rotation + dp * np.arange(npitch), env.max_angle_rotation)
+
+        def ellipse(x, z):
+            return ((x - env.h) ** 2) / (env.a ** 2) + ((z - env.k) ** 2) / (env.b ** 2)
+
+        # a cell is valid only when its four corners are inside, so lookups never accept a point outside
+        corners = ellipse(x_edges[:, None], z_edges[None, :]) <= 1
+        inside = corners[:-1, :-1] & corners[1:, :-1] & corners[:-1, 1:] & corners[1:, 1:]
+        valid = np.repeat(inside[:, :, None], npitch, axis=2)
+
+        # radial approximation of the distance to the boundary
+        clearance_xz = (1 - np.sqrt(ellipse(x_centres[:, None], z_centres[None, :]))) * min(env.a, env.b)
+        clearance = np.repeat(clearance_xz[:, :, None], npitch, axis=2).astype(np.float32)
+
+        kinematic = np.zeros((nx, nz, npitch), dtype=np.uint8)
+        if env.kinematics is not None:
+            X, Z, P = np.meshgrid(x_centres, z_centres, pitches, indexing='ij')
+            poses = np.column_stack((X.ravel(), np.full(X.size, params["y"]), Z.ravel(),
+                                     np.full(X.size, params["roll"]), P.ravel(), np.full(X.size, params["yaw"])))
+            kinematic = env.kinematic_reasons(env.prepare_many(poses), params["reference_joints"]).reshape(nx, nz, npitch)
+
+        return cls(params, valid, kinematic, clearance)
+
+    @staticmethod
+    def path_for(params, directory):
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+        return os.path.join(directory, f"workspace_{digest}.npz")
+
+    @classmethod
+    def load_or_build(cls, env, resolution=(0.01, 0.01, 2.0), directory=DEFAULT_DIRECTORY):
+        # the file name is a hash of the workspace parameters, so changing them in Environment triggers a rebuild
+        params = cls.parameters(env, resolution)
+        path = cls.path_for(params, directory)
+        if os.path.exists(path):
+            data = np.load(path)
+            return cls(params, data["valid"], data["kinematic"], data["clearance"])
+
+        logger.info("Building workspace index, this takes a few seconds")
+        index = cls.build(env, resolution)
+        os.makedirs(directory, exist_ok=True)
+        np.savez(path, valid=index.valid, kinematic=index.kinematic, clearance=index.clearance)
+        return index
+
+    def cells(self, poses):
+        # (N, 6) x, y, z, roll, pitch, yaw -> (N, 3) cell indices and (N,) mask of the ones inside the grid
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        idx = np.floor((poses[:, [0, 2, 4]] - self.origin) / self.step).astype(np.int64)
+        # pitch_max sits exactly on the last cell
+        idx[:, 2] = np.where(poses[:, 4] == self.params["pitch_max"], self.shape[2] - 1, idx[:, 2])
+        in_grid = np.all((idx >= 0) & (idx < self.shape), axis=1)
+        idx[~in_grid] = 0
+        return idx, in_grid
+
+    def kinematic_reasons(self, poses):
+        idx, in_grid = self.cells(poses)
+        reasons = self.kinematic[idx[:, 0], idx[:, 1], idx[:, 2]]
+        return np.where(in_grid, reasons, 0).astype(np.uint8)
+
+    def lookup(self, poses):
+        # (N, 6) -> (valid and reachable mask, clearance in meters), y, pitch, roll and yaw are checked directly
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        idx, in_grid = self.cells(poses)
+        i, j, k = idx[:, 0], idx[:, 1], idx[:, 2]
+        ok = in_grid & self.valid[i, j, k] & (self.kinematic[i, j, k] == 0)
+        ok &= (poses[:, 4] >= self.params["pitch_min"]) & (poses[:, 4] <= self.params["pitch_max"])
+        ok &= np.abs(poses[:, 1] - self.params["y"]) <= self.params["y_tolerance"]
+        ok &= (poses[:, 3] == self.params["roll"]) & (poses[:, 5] == self.params["yaw"])
+        clearance = np.where(in_grid, self.clearance[i, j, k], -np.inf)
+        return ok, clearance
+
+    def lookup_one(self, pose):
+        ok, clearance = self.lookup(pose)
+        return bool(ok[0]), float(clearance[0])
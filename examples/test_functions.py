@@ -6,12 +6,14 @@ import time
 from math import pi
 import logging
 from pathlib import Path
+import sys
+import numpy as np
 
 import collections
 collections.Iterable = collections.abc.Iterable # Need this for math3d lib issues
 
-
-logging.basicConfig(level=logging.INFO)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from environment.telemetry import COLUMNS, TelemetryPoller, read_snapshot
 
 
 def read_config_file():
@@ -22,15 +24,31 @@ def read_config_file():
     return config
 
 def read_data_from_robot(robot):
-    j_temp = robot.get_joint_temperature()
-    j_voltage = robot.get_joint_voltage()
-    j_current = robot.get_joint_current()
-    main_voltage = robot.get_main_voltage()
-    robot_voltage = robot.get_robot_voltage()
-    robot_current = robot.get_robot_current()
+    # one secondary monitor packet instead of a request per value, the main voltage comes from the realtime one
+    row = np.empty(len(COLUMNS), dtype=np.float32)
+    read_snapshot(robot, row)
+    data = dict(zip(COLUMNS, row.tolist()))
+
+    j_temp = [data[f"T_motor{j}"] for j in range(6)]
+    j_voltage = [data[f"V_actual{j}"] for j in range(6)]
+    j_current = [data[f"I_actual{j}"] for j in range(6)]
+    main_voltage = data["mainVoltage"]
+    robot_voltage = data["robotVoltage48V"]
+    robot_current = data["robotCurrent"]
 
     logging.info("Data From the Robot:")
-    logging.info("Joint Temperature: %s, Joint Voltage: %s, Joint Current: %s, Main Voltage: %s", j_temp, j_voltage, j_current,  main_voltage)
+    logging.info("Joint Temperature: %s, Joint Voltage: %s, Joint Current: %s, Main Voltage: %s, Robot Voltage: %s, Robot Current: %s",
+                 j_temp, j_voltage, j_current, main_voltage, robot_voltage, robot_current)
+
+
+def log_telemetry(robot, seconds=10.0):
+    # background sampling, prints the newest snapshot once a second
+    poller = TelemetryPoller(robot, rate=10.0)
+    poller.start()
+    for _ in range(int(seconds)):
+        time.sleep(1.0)
+        logging.info("Telemetry: %s", poller.latest())
+    poller.stop()
 
 
 def move_robot_simple(robot):
@@ -159,6 +177,7 @@ def swinging(robot):
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
 
     config = read_config_file()
     ip_address_robot = config['ip_robot']
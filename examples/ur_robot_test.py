@@ -5,7 +5,6 @@ import math
 import random
 from math import pi
 import logging
-logging.basicConfig(level=logging.INFO)
 import collections
 collections.Iterable = collections.abc.Iterable # Need this for math3d lib issues
 import math3d
@@ -158,6 +157,7 @@ def read_config_file():
     return config
 
 def main():
+    logging.basicConfig(level=logging.INFO)
     config = read_config_file()
     ip_address_robot = config['ip_robot']
 
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from tools.kinematics import (UR5Kinematics, forward_kinematics, inverse_kinematics, inverse_kinematics_one, matrix_to_pose,
+                              pose_to_matrix, singularity_margins)
+from environment.sim_robot import SimRobot
+from environment.main_environment_ur5 import Environment, POSE_VALID
+
+
+@pytest.fixture
+def env():
+    return Environment(SimRobot(), seed=0)
+
+
+def random_joints(count, seed=0):
+    # joints away from the wrist, elbow and shoulder singularities, where IK is well conditioned
+    rng = np.random.default_rng(seed)
+    joints = rng.uniform(-np.pi, np.pi, size=(4 * count, 6))
+    margins = singularity_margins(joints)
+    return joints[np.all(margins > 0.1, axis=1)][:count]
+
+
+def test_fk_ik_round_trip():
+    joints = random_joints(200)
+    T = forward_kinematics(joints)
+    solutions, valid = inverse_kinematics(T)
+
+    # every solution IK returns lands on the same flange pose
+    for i in range(len(joints)):
+        assert valid[i].any()
+        np.testing.assert_allclose(forward_kinematics(solutions[i][valid[i]]), np.repeat(T[i][None], valid[i].sum(), axis=0), atol=1e-6)
+
+    # and one of them is the joints the pose came from
+    difference = (solutions - joints[:, None] + np.pi) % (2 * np.pi) - np.pi
+    error = np.where(valid, np.max(np.abs(difference), axis=-1), np.inf)
+    assert np.all(error.min(axis=1) < 1e-6)
+
+
+def test_single_pose_ik_matches_batch():
+    rng = np.random.default_rng(2)
+    poses = np.vstack((matrix_to_pose(forward_kinematics(rng.uniform(-np.pi, np.pi, (200, 6)))), rng.uniform(-1, 1, (100, 6))))
+    solutions, valid = inverse_kinematics(pose_to_matrix(poses))
+    for i in range(len(poses)):
+        one_solutions, one_valid = inverse_kinematics_one(poses[i])
+        np.testing.assert_array_equal(one_valid, valid[i])
+        difference = (one_solutions[one_valid] - solutions[i][one_valid] + np.pi) % (2 * np.pi) - np.pi
+        assert np.all(np.abs(difference) < 1e-7)
+
+
+def test_home_pose_reachable(env):
+    home = env.home_position + env.home_orientation
+    valid, reasons = env.validate_points(home)
+    assert valid[0] and reasons[0] == POSE_VALID
+
+    reachable, near_singular, joints = UR5Kinematics().check(env.prepare_many(home), env.home_joints)
+    assert reachable[0] and not near_singular[0]
+
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from environment.sim_robot import SimRobot
+from environment.main_environment_ur5 import Environment, POSE_VALID
+
+
+@pytest.fixture
+def env():
+    return Environment(SimRobot(), seed=0)
+
+
+def test_project_points_inside_ellipse(env):
+    rng = np.random.default_rng(1)
+    count = 500
+    poses = np.column_stack((env.h + rng.uniform(-3, 3, count) * env.a, env.home_position[1] + rng.uniform(-0.05, 0.05, count),
+                             env.k + rng.uniform(-3, 3, count) * env.b, rng.uniform(-180, 180, count),
+                             rng.uniform(-120, 120, count), rng.uniform(-180, 180, count)))
+    projected, distance = env.project_points(poses)
+
+    ellipse = ((projected[:, 0] - env.h) / env.a) ** 2 + ((projected[:, 2] - env.k) / env.b) ** 2
+    assert np.all(ellipse <= 1)
+    assert np.all(env.position_reasons(projected[:, :3]) == POSE_VALID)
+    assert np.all(env.orientation_reasons(projected[:, 3:]) == POSE_VALID)
+    assert np.all(distance >= 0)
+
+    # poses already inside keep their position
+    inside = ((poses[:, 0] - env.h) / env.a) ** 2 + ((poses[:, 2] - env.k) / env.b) ** 2 <= 1
+    np.testing.assert_array_equal(projected[inside][:, [0, 2]], poses[inside][:, [0, 2]])
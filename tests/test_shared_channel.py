@@ -0,0 +1,39 @@
+import os
+import sys
+import subprocess
+import numpy as np
+
+from environment.shared_channel import SharedChannel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a learner in its own interpreter, not a child of this process, like the README setup
+LEARNER = """
+import sys
+from environment.shared_channel import SharedChannel
+channel = SharedChannel(sys.argv[1])
+record = channel.observations.wait_newest(timeout=5.0)
+channel.actions.write(record.values[:6] + 1.0, ref=record.seq)
+channel.memory.close()  # leave without setting the closed flag, the control side keeps running
+"""
+
+
+def run_learner(name):
+    return subprocess.run([sys.executable, "-c", LEARNER, name], cwd=ROOT, capture_output=True, text=True, timeout=30)
+
+
+def test_learner_in_another_process_does_not_remove_the_block():
+    channel = SharedChannel()
+    try:
+        channel.observations.write(np.arange(12.0))
+        for restart in range(2):
+            # a restarted learner attaches by name again, the block must outlive the first one
+            result = run_learner(channel.name)
+            assert result.returncode == 0, result.stderr
+            assert "leaked" not in result.stderr
+
+            record = channel.actions.take_newest()
+            assert record is not None
+            np.testing.assert_array_equal(record.values, np.arange(6.0) + 1.0)
+    finally:
+        channel.close()  # raises when the learner's resource tracker already unlinked the block
@@ -0,0 +1,134 @@
+import csv
+import json
+import time
+import functools
+import contextlib
+import numpy as np
+
+# log-spaced latency bins from 10 us to 100 s, shared by every histogram
+BIN_EDGES = np.logspace(-5, 2, 71)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = np.zeros(len(BIN_EDGES) + 1, dtype=np.int64)  # plus under and overflow bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[np.searchsorted(BIN_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # upper edge of the bin holding the q-th percentile
+        if self.count == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        return float(BIN_EDGES[min(i, len(BIN_EDGES) - 1)])
+
+    def summary(self):
+        return {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99), "max": self.max}
+
+
+class Instrumentation:
+    # Monotonic timers for robot commands and episode phases, disabled it hands back the untouched objects
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.episodes = []  # seconds spent per phase, one dict per episode
+        self.current_episode = {}
+
+    def add(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def timed(self, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return wrapper
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def phase(self, name):
+        # time a block of an episode, e.g. with instrumentation.phase("action"): env.hard_code_solution()
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.phase_timer(name)
+
+    @contextlib.contextmanager
+    def phase_timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.current_episode[name] = self.current_episode.get(name, 0.0) + seconds
+            self.add("phase." + name, seconds)
+
+    def end_episode(self):
+        if self.enabled and self.current_episode:
+            self.episodes.append(self.current_episode)
+            self.current_episode = {}
+
+    def wrap_robot(self, robot, commands=("movel", "movej", "movels", "send_program", "is_program_running", "getl", "getj")):
+        if not self.enabled:
+            return robot
+        return InstrumentedRobot(robot, self, commands)
+
+    def wrap_environment(self, env, methods=("check_point", "validate_points", "prepare", "prepare_many", "reset_task", "hard_code_solution", "step", "get_state")):
+        # replaces the bound methods on this instance only, the class is left alone
+        if not self.enabled:
+            return env
+        for name in methods:
+            setattr(env, name, self.timed("env." + name, getattr(env, name)))
+        return env
+
+    def wrap_function(self, module, name):
+        # for module level helpers such as prepare_point, patches the name the module looks up
+        if self.enabled:
+            setattr(module, name, self.timed(module.__name__.rsplit(".", 1)[-1] + "." + name, getattr(module, name)))
+
+    def summary(self):
+        return {"commands": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+                "episodes": self.episodes}
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "count", "total", "mean", "p50", "p90", "p99", "max"])
+            for name, values in self.summary()["commands"].items():
+                writer.writerow([name, values["count"], values["total"], values["mean"], values["p50"], values["p90"], values["p99"], values["max"]])
+
+
+class InstrumentedRobot:
+    # Proxy around a urx.Robot (or SimRobot), the listed commands are timed and everything else passes straight through
+    def __init__(self, robot, instrumentation, commands):
+        self.robot = robot
+        for name in commands:
+            if hasattr(robot, name):
+                setattr(self, name, instrumentation.timed("robot." + name, getattr(robot, name)))
+
+    def __getattr__(self, name):
+        return getattr(self.robot, name)
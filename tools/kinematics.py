@@ -0,0 +1,318 @@
+import math
+import functools
+import numpy as np
+
+from tools.util import quattorotvec_batch
+
+# UR5 standard DH parameters
+UR5_D = np.array([0.089159, 0.0, 0.0, 0.10915, 0.09465, 0.0823])
+UR5_A = np.array([0.0, -0.425, -0.39225, 0.0, 0.0, 0.0])
+UR5_ALPHA = np.array([np.pi / 2, 0.0, 0.0, np.pi / 2, -np.pi / 2, 0.0])
+
+
+def rotvec_to_matrix(rotvecs):
+    # (N, 3) rotation vectors -> (N, 3, 3), Rodrigues
+    rotvecs = np.asarray(rotvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rotvecs, axis=1)
+    small = theta < 1e-12
+    axis = rotvecs / np.where(small, 1.0, theta)[:, None]
+    x, y, z = axis[:, 0], axis[:, 1], axis[:, 2]
+    c, s = np.cos(theta), np.sin(theta)
+    C = 1 - c
+
+    R = np.empty((rotvecs.shape[0], 3, 3))
+    R[:, 0, 0] = c + x * x * C
+    R[:, 0, 1] = x * y * C - z * s
+    R[:, 0, 2] = x * z * C + y * s
+    R[:, 1, 0] = y * x * C + z * s
+    R[:, 1, 1] = c + y * y * C
+    R[:, 1, 2] = y * z * C - x * s
+    R[:, 2, 0] = z * x * C - y * s
+    R[:, 2, 1] = z * y * C + x * s
+    R[:, 2, 2] = c + z * z * C
+    return R
+
+
+def matrix_to_rotvec(R):
+    # (N, 3, 3) -> (N, 3), goes through the quaternion so theta ~ 0 and theta ~ pi stay well defined
+    R = np.asarray(R, dtype=np.float64)
+    trace = R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2]
+    # largest of w, x, y, z first, then the others from it (Shepperd)
+    candidates = np.stack((trace, R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]), axis=1)
+    k = np.argmax(candidates, axis=1)
+    quat = np.empty((R.shape[0], 4))
+
+    i = k == 0
+    t = np.sqrt(1 + trace[i]) * 2
+    quat[i] = np.stack((t / 4, (R[i, 2, 1] - R[i, 1, 2]) / t, (R[i, 0, 2] - R[i, 2, 0]) / t, (R[i, 1, 0] - R[i, 0, 1]) / t), axis=1)
+    i = k == 1
+    t = np.sqrt(1 + R[i, 0, 0] - R[i, 1, 1] - R[i, 2, 2]) * 2
+    quat[i] = np.stack(((R[i, 2, 1] - R[i, 1, 2]) / t, t / 4, (R[i, 0, 1] + R[i, 1, 0]) / t, (R[i, 0, 2] + R[i, 2, 0]) / t), axis=1)
+    i = k == 2
+    t = np.sqrt(1 - R[i, 0, 0] + R[i, 1, 1] - R[i, 2, 2]) * 2
+    quat[i] = np.stack(((R[i, 0, 2] - R[i, 2, 0]) / t, (R[i, 0, 1] + R[i, 1, 0]) / t, t / 4, (R[i, 1, 2] + R[i, 2, 1]) / t), axis=1)
+    i = k == 3
+    t = np.sqrt(1 - R[i, 0, 0] - R[i, 1, 1] + R[i, 2, 2]) * 2
+    quat[i] = np.stack(((R[i, 1, 0] - R[i, 0, 1]) / t, (R[i, 0, 2] + R[i, 2, 0]) / t, (R[i, 1, 2] + R[i, 2, 1]) / t, t / 4), axis=1)
+    return quattorotvec_batch(quat)
+
+
+def pose_to_matrix(poses):
+    # (N, 6) x, y, z, rx, ry, rz -> (N, 4, 4)
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+    T = np.zeros((poses.shape[0], 4, 4))
+    T[:, :3, :3] = rotvec_to_matrix(poses[:, 3:])
+    T[:, :3, 3] = poses[:, :3]
+    T[:, 3, 3] = 1.0
+    return T
+
+
+def matrix_to_pose(T):
+    T = np.asarray(T, dtype=np.float64)
+    poses = np.empty((T.shape[0], 6))
+    poses[:, :3] = T[:, :3, 3]
+    poses[:, 3:] = matrix_to_rotvec(T[:, :3, :3])
+    return poses
+
+
+def dh_transform(theta, i):
+    # theta of any shape -> (..., 4, 4) transform of link i
+    theta = np.asarray(theta, dtype=np.float64)
+    c, s = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(UR5_ALPHA[i]), np.sin(UR5_ALPHA[i])
+    T = np.zeros(theta.shape + (4, 4))
+    T[..., 0, 0] = c
+    T[..., 0, 1] = -s * ca
+    T[..., 0, 2] = s * sa
+    T[..., 0, 3] = UR5_A[i] * c
+    T[..., 1, 0] = s
+    T[..., 1, 1] = c * ca
+    T[..., 1, 2] = -c * sa
+    T[..., 1, 3] = UR5_A[i] * s
+    T[..., 2, 1] = sa
+    T[..., 2, 2] = ca
+    T[..., 2, 3] = UR5_D[i]
+    T[..., 3, 3] = 1.0
+    return T
+
+
+def invert_transform(T):
+    R = T[..., :3, :3]
+    Ti = np.zeros_like(T)
+    Ti[..., :3, :3] = np.swapaxes(R, -1, -2)
+    Ti[..., :3, 3] = -np.einsum('...ji,...j->...i', R, T[..., :3, 3])
+    Ti[..., 3, 3] = 1.0
+    return Ti
+
+
+def forward_kinematics(joints):
+    # (N, 6) joints in rad -> (N, 4, 4) base to flange
+    joints = np.asarray(joints, dtype=np.float64).reshape(-1, 6)
+    T = dh_transform(joints[:, 0], 0)
+    for i in range(1, 6):
+        T = T @ dh_transform(joints[:, i], i)
+    return T
+
+
+def inverse_kinematics(T):
+    # (N, 4, 4) base to flange -> (N, 8, 6) joint solutions and (N, 8) mask of the ones that exist
+    # branches are ordered shoulder (left/right) x wrist (up/down) x elbow (up/down)
+    T = np.asarray(T, dtype=np.float64).reshape(-1, 4, 4)
+    n = T.shape[0]
+    d4, d6 = UR5_D[3], UR5_D[5]
+    a2, a3 = UR5_A[1], UR5_A[2]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # theta 1, from the wrist centre P05, shape (N, 2)
+        p05 = T[:, :3, 3] - d6 * T[:, :3, 2]
+        radius = np.hypot(p05[:, 0], p05[:, 1])
+        psi = np.arccos(d4 / radius)
+        reachable = radius >= abs(d4)
+        phi = np.arctan2(p05[:, 1], p05[:, 0])
+        theta1 = phi[:, None] + np.stack((psi, -psi), axis=1) + np.pi / 2
+
+        # theta 5, shape (N, 2, 2)
+        s1, c1 = np.sin(theta1), np.cos(theta1)
+        p06 = T[:, :3, 3]
+        cos5 = (p06[:, 0, None] * s1 - p06[:, 1, None] * c1 - d4) / d6
+        reachable = reachable[:, None] & (np.abs(cos5) <= 1 + 1e-9)
+        acos5 = np.arccos(np.clip(cos5, -1, 1))
+        theta5 = np.stack((acos5, -acos5), axis=2)
+        reachable = np.repeat(reachable[:, :, None], 2, axis=2)
+
+        # theta 6, from the rows of R06, free when the wrist is singular so it is left at 0
+        R = T[:, :3, :3]
+        s1, c1 = s1[:, :, None], c1[:, :, None]
+        s5 = np.sin(theta5)
+        y_num = (-R[:, 0, 1, None, None] * s1 + R[:, 1, 1, None, None] * c1)
+        x_num = (R[:, 0, 0, None, None] * s1 - R[:, 1, 0, None, None] * c1)
+        wrist_ok = np.abs(s5) > 1e-9
+        theta6 = np.where(wrist_ok, np.arctan2(y_num / np.where(wrist_ok, s5, 1.0), x_num / np.where(wrist_ok, s5, 1.0)), 0.0)
+
+        # theta 3, 2 and 4 from the planar chain T14, it lies in the x-y plane of frame 1, shape (N, 2, 2, 2)
+        t1 = np.broadcast_to(theta1[:, :, None], theta5.shape)
+        T14 = invert_transform(dh_transform(t1, 0)) @ T[:, None, None] @ invert_transform(dh_transform(theta6, 5)) @ invert_transform(dh_transform(theta5, 4))
+        p14x, p14y = T14[..., 0, 3], T14[..., 1, 3]
+        cos3 = (p14x ** 2 + p14y ** 2 - a2 ** 2 - a3 ** 2) / (2 * a2 * a3)
+        reachable = reachable & (np.abs(cos3) <= 1 + 1e-9)
+        acos3 = np.arccos(np.clip(cos3, -1, 1))
+        theta3 = np.stack((acos3, -acos3), axis=3)
+        reachable = np.repeat(reachable[..., None], 2, axis=3)
+
+        theta2 = np.arctan2(p14y, p14x)[..., None] - np.arctan2(a3 * np.sin(theta3), a2 + a3 * np.cos(theta3))
+
+        T34 = invert_transform(dh_transform(theta2, 1) @ dh_transform(theta3, 2)) @ T14[..., None, :, :]
+        theta4 = np.arctan2(T34[..., 1, 0], T34[..., 0, 0])
+
+    shape = theta3.shape
+    solutions = np.stack((np.broadcast_to(theta1[:, :, None, None], shape), theta2, theta3, theta4,
+                          np.broadcast_to(theta5[..., None], shape), np.broadcast_to(theta6[..., None], shape)), axis=-1)
+    solutions = (solutions + np.pi) % (2 * np.pi) - np.pi  # wrap to [-pi, pi)
+    return solutions.reshape(n, 8, 6), reachable.reshape(n, 8)
+
+
+def inverse_kinematics_one(pose):
+    # one x, y, z, rx, ry, rz pose -> (8, 6) solutions and (8,) mask, same branches as inverse_kinematics
+    # plain math, for a single pose the numpy version is mostly call overhead
+    d1, d4, d5, d6 = float(UR5_D[0]), float(UR5_D[3]), float(UR5_D[4]), float(UR5_D[5])
+    a2, a3 = float(UR5_A[1]), float(UR5_A[2])
+    px, py, pz, rx, ry, rz = (float(value) for value in pose)
+
+    # Rodrigues, as in rotvec_to_matrix
+    theta = math.sqrt(rx * rx + ry * ry + rz * rz)
+    x, y, z = (rx / theta, ry / theta, rz / theta) if theta >= 1e-12 else (rx, ry, rz)
+    c, s = math.cos(theta), math.sin(theta)
+    C = 1 - c
+    R = ((c + x * x * C, x * y * C - z * s, x * z * C + y * s),
+         (y * x * C + z * s, c + y * y * C, y * z * C - x * s),
+         (z * x * C - y * s, z * y * C + x * s, c + z * z * C))
+
+    solutions = []
+    valid = []
+    p05x, p05y = px - d6 * R[0][2], py - d6 * R[1][2]
+    radius = math.hypot(p05x, p05y)
+    if radius < abs(d4):
+        return np.full((8, 6), np.nan), np.zeros(8, dtype=bool)
+    psi = math.acos(d4 / radius)
+    phi = math.atan2(p05y, p05x)
+
+    for theta1 in (phi + psi + math.pi / 2, phi - psi + math.pi / 2):
+        s1, c1 = math.sin(theta1), math.cos(theta1)
+        cos5 = (px * s1 - py * c1 - d4) / d6
+        ok5 = abs(cos5) <= 1 + 1e-9
+        acos5 = math.acos(min(max(cos5, -1.0), 1.0))
+        y_num = -R[0][1] * s1 + R[1][1] * c1
+        x_num = R[0][0] * s1 - R[1][0] * c1
+        # rows 0 and 1 of inv(A1) @ T
+        m0 = (c1 * R[0][0] + s1 * R[1][0], c1 * R[0][1] + s1 * R[1][1], c1 * R[0][2] + s1 * R[1][2], c1 * px + s1 * py)
+        m1 = (R[2][0], R[2][1], R[2][2], pz - d1)
+
+        for theta5 in (acos5, -acos5):
+            s5, c5 = math.sin(theta5), math.cos(theta5)
+            theta6 = math.atan2(y_num / s5, x_num / s5) if abs(s5) > 1e-9 else 0.0
+            s6, c6 = math.sin(theta6), math.cos(theta6)
+
+            # T14 = inv(A1) @ T @ inv(A6) @ inv(A5), its first column and position in the plane of joints 2 to 4
+            r00 = m0[0] * c6 * c5 - m0[1] * s6 * c5 - m0[2] * s5
+            r10 = m1[0] * c6 * c5 - m1[1] * s6 * c5 - m1[2] * s5
+            p14x = m0[0] * s6 * d5 + m0[1] * c6 * d5 - m0[2] * d6 + m0[3]
+            p14y = m1[0] * s6 * d5 + m1[1] * c6 * d5 - m1[2] * d6 + m1[3]
+            phi4 = math.atan2(r10, r00)
+
+            cos3 = (p14x ** 2 + p14y ** 2 - a2 ** 2 - a3 ** 2) / (2 * a2 * a3)
+            ok3 = abs(cos3) <= 1 + 1e-9
+            acos3 = math.acos(min(max(cos3, -1.0), 1.0))
+            for theta3 in (acos3, -acos3):
+                theta2 = math.atan2(p14y, p14x) - math.atan2(a3 * math.sin(theta3), a2 + a3 * math.cos(theta3))
+                # joints 2, 3 and 4 are parallel, so their angles add up to the planar rotation of T14
+                theta4 = phi4 - theta2 - theta3
+                solutions.append([(q + math.pi) % (2 * math.pi) - math.pi for q in (theta1, theta2, theta3, theta4, theta5, theta6)])
+                valid.append(ok5 and ok3)
+    return np.array(solutions), np.array(valid)
+
+
+def singularity_margins(joints):
+    # (..., 6) -> (..., 3) distance to the wrist, elbow and shoulder singularities, small means close
+    joints = np.asarray(joints, dtype=np.float64)
+    wrist = np.abs(np.sin(joints[..., 4]))
+    elbow = np.abs(np.sin(joints[..., 2]))
+    # shoulder: wrist centre on the joint 1 axis, measured from the planar reach of joints 2 and 3
+    shoulder = np.abs(UR5_A[1] * np.cos(joints[..., 1]) + UR5_A[2] * np.cos(joints[..., 1] + joints[..., 2])
+                      + UR5_D[4] * np.sin(joints[..., 1] + joints[..., 2] + joints[..., 3]))
+    return np.stack((wrist, elbow, shoulder), axis=-1)
+
+
+def nearest_solution(solutions, valid, current_joints):
+    # (N, 8, 6) solutions -> (N, 6) closest to current_joints after unwrapping each joint, (N,) False where none exist
+    current = np.asarray(current_joints, dtype=np.float64)
+    current = current.reshape(-1, 1, 6)
+    unwrapped = current + (solutions - current + np.pi) % (2 * np.pi) - np.pi
+    distance = np.where(valid, np.max(np.abs(unwrapped - current), axis=-1), np.inf)
+    best = np.argmin(distance, axis=1)
+    rows = np.arange(solutions.shape[0])
+    return unwrapped[rows, best], np.isfinite(distance[rows, best])
+
+
+class UR5Kinematics:
+    # Batched reachability checks for x, y, z, rx, ry, rz poses with an LRU cache for single repeated poses
+    def __init__(self, wrist_margin=0.05, elbow_margin=0.05, shoulder_margin=0.02, cache_size=4096):
+        self.wrist_margin = wrist_margin  # |sin(q5)|
+        self.elbow_margin = elbow_margin  # |sin(q3)|
+        self.shoulder_margin = shoulder_margin  # meters from the joint 1 axis
+        self.cached_ik = functools.lru_cache(maxsize=cache_size)(self.solve_one)
+        self.cached_check = functools.lru_cache(maxsize=cache_size)(self.check_one)
+
+    def solve_one(self, pose):
+        solutions, valid = inverse_kinematics_one(pose)
+        solutions.setflags(write=False)
+        valid.setflags(write=False)
+        return solutions, valid
+
+    def solve(self, poses):
+        # (N, 6) poses -> (N, 8, 6) solutions, (N, 8) valid, cached when there is a single pose
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        if poses.shape[0] == 1:
+            solutions, valid = self.cached_ik(tuple(poses[0].tolist()))
+            return solutions[None], valid[None]
+        return inverse_kinematics(pose_to_matrix(poses))
+
+    def near_singular(self, joints):
+        margins = singularity_margins(joints)
+        return (margins[..., 0] < self.wrist_margin) | (margins[..., 1] < self.elbow_margin) | (margins[..., 2] < self.shoulder_margin)
+
+    def check_one(self, pose, current_joints):
+        # nearest_solution and near_singular for one pose in plain math, the first branch wins ties like argmin
+        solutions, valid = self.cached_ik(pose)
+        best, best_distance = None, math.inf
+        for solution, ok in zip(solutions.tolist(), valid.tolist()):
+            unwrapped = [c + (q - c + math.pi) % (2 * math.pi) - math.pi for q, c in zip(solution, current_joints)]
+            if best is None:
+                best = unwrapped
+            distance = max(abs(u - c) for u, c in zip(unwrapped, current_joints)) if ok else math.inf
+            if distance < best_distance:
+                best, best_distance = unwrapped, distance
+        joints = np.array([best])
+        joints.setflags(write=False)
+        reachable = best_distance < math.inf
+
+        q2, q3, q4, q5 = best[1:5]
+        shoulder = abs(float(UR5_A[1]) * math.cos(q2) + float(UR5_A[2]) * math.cos(q2 + q3) + float(UR5_D[4]) * math.sin(q2 + q3 + q4))
+        near_singular = reachable and (abs(math.sin(q5)) < self.wrist_margin or abs(math.sin(q3)) < self.elbow_margin
+                                       or shoulder < self.shoulder_margin)
+        return reachable, near_singular, joints
+
+    def check(self, poses, current_joints):
+        # (N, 6) poses -> (reachable, near singular, joints of the branch nearest current_joints)
+        # a single pose keeps the whole result cached, with the joints rounded to a milliradian
+        # so a standing arm read from the realtime stream still hits
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+        if poses.shape[0] == 1:
+            key = tuple(np.round(np.asarray(current_joints, dtype=np.float64), 3).tolist())
+            reachable, near_singular, joints = self.cached_check(tuple(poses[0].tolist()), key)
+            return np.array([reachable]), np.array([near_singular]), joints.copy()
+        return self.check_batch(poses, current_joints)
+
+    def check_batch(self, poses, current_joints):
+        solutions, valid = self.solve(poses)
+        joints, reachable = nearest_solution(solutions, valid, current_joints)
+        return reachable, reachable & self.near_singular(joints), joints
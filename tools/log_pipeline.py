@@ -0,0 +1,97 @@
+import time
+import queue
+import logging
+import logging.handlers
+
+
+class RateLimitFilter(logging.Filter):
+    # Token bucket per call site (logger, file, line), so one chatty message can not flood the log.
+    # Runs in the calling thread before the record is queued, a suppressed message costs a dict lookup.
+    def __init__(self, rate=5.0, burst=10):
+        super().__init__()
+        self.rate = rate  # messages per second per call site
+        self.burst = burst
+        self.buckets = {}  # key -> [tokens, last update, suppressed since the last one that went through]
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno)
+        now = record.created
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            self.suppressed += 1
+            return False
+        bucket[0] -= 1
+        record.suppressed = bucket[2]
+        bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the caller: formatting happens in the listener thread and a full queue drops the record
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record  # same process, the listener formats it later
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class CompactFormatter(logging.Formatter):
+    # one line per event: seconds since start, level letter, logger:line, message, suppressed count when there is one
+    #   12.345 E environment.main_environment_ur5:252 Point X o Z is outside the boundaries of the ellipse [x3 suppressed]
+    def __init__(self):
+        super().__init__()
+        self.start = time.time()
+
+    def format(self, record):
+        line = f"{record.created - self.start:.3f} {record.levelname[0]} {record.name}:{record.lineno} {record.getMessage()}"
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += f" [x{suppressed} suppressed]"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class LogPipeline:
+    # Routes the root logger through a bounded queue to a background listener that does the formatting and I/O.
+    # Nothing is configured on import, the entry point creates one: pipeline = LogPipeline(); ... pipeline.stop()
+    def __init__(self, level=logging.INFO, handlers=None, rate=5.0, burst=10, queue_size=10000, logger=None):
+        self.logger = logging.getLogger() if logger is None else logger
+        if handlers is None:
+            handlers = [logging.StreamHandler()]
+        formatter = CompactFormatter()
+        for handler in handlers:
+            if handler.formatter is None:
+                handler.setFormatter(formatter)
+
+        self.rate_limit = RateLimitFilter(rate, burst)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(self.rate_limit)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *handlers, respect_handler_level=True)
+
+        self.logger.setLevel(level)
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self):
+        # flushes what is still queued
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+
+    def stats(self):
+        return {"enqueued": self.handler.enqueued, "dropped": self.handler.dropped, "suppressed": self.rate_limit.suppressed}
@@ -0,0 +1,45 @@
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    # Preallocated ring of timestamped rows, one writer thread and any number of readers.
+    # fields maps a name to (columns, dtype), every push writes one row of each, in that order.
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)
+        self.fields = {name: np.full((capacity, columns), np.nan, dtype=dtype) for name, (columns, dtype) in fields.items()}
+        self.count = 0  # total rows written, the newest one is at (count - 1) % capacity
+
+        self.lock = threading.Lock()
+        self.new_row = threading.Condition(self.lock)
+
+    def push(self, timestamp, *values):
+        with self.new_row:
+            i = self.count % self.capacity
+            self.timestamps[i] = timestamp
+            for array, value in zip(self.fields.values(), values):
+                array[i] = value
+            self.count += 1
+            self.new_row.notify_all()
+
+    def wait_for_newer(self, count, timeout=1.0):
+        # blocks until more than count rows were written, returns the new total
+        with self.new_row:
+            self.new_row.wait_for(lambda: self.count > count, timeout)
+            return self.count
+
+    def latest(self):
+        # (timestamp, field values...) of the newest row, copies, None before the first push
+        with self.lock:
+            if self.count == 0:
+                return None
+            i = (self.count - 1) % self.capacity
+            return (float(self.timestamps[i]),) + tuple(array[i].copy() for array in self.fields.values())
+
+    def window(self, n):
+        # the newest n rows, oldest first, as (timestamps, field arrays...)
+        with self.lock:
+            n = min(n, self.count, self.capacity)
+            idx = np.arange(self.count - n, self.count) % self.capacity
+            return (self.timestamps[idx],) + tuple(array[idx] for array in self.fields.values())
@@ -0,0 +1,81 @@
+import numpy as np
+
+from tools.util import rotvectoquat_batch, quattorotvec_batch, slerp_batch, linear_move_duration
+from tools.kinematics import UR5Kinematics, nearest_solution
+
+# Half of the UR5 maximum joint speed, and a joint acceleration that keeps the cup steady
+JOINT_VEL_LIMITS = np.full(6, np.pi / 2)  # rad/s
+JOINT_ACC_LIMITS = np.full(6, 4.0)  # rad/s^2
+
+
+class WaypointScheduler:
+    # Picks movel speed, acceleration and blend radius per segment of a waypoint list so that no joint goes over
+    # its limits, instead of one vel/acc for everything. A segment is as fast as the joint that moves the most
+    # relative to the tool allows, capped by max_vel / max_acc for the tool itself.
+    def __init__(self, kinematics=None, joint_vel=JOINT_VEL_LIMITS, joint_acc=JOINT_ACC_LIMITS, max_vel=1.0, max_acc=9.5,
+                 max_radius=0.05, samples=20):
+        self.kinematics = UR5Kinematics() if kinematics is None else kinematics
+        self.joint_vel = np.broadcast_to(np.asarray(joint_vel, dtype=np.float64), (6,))
+        self.joint_acc = np.broadcast_to(np.asarray(joint_acc, dtype=np.float64), (6,))
+        self.max_vel = max_vel
+        self.max_acc = max_acc
+        self.max_radius = max_radius
+        self.samples = samples  # IK samples per segment to find the largest joint motion along it
+
+    def segment_joints(self, starts, targets, start_joints):
+        # (N, samples + 1, 6) joints along every straight segment, NaN where there is no IK solution
+        count = len(targets)
+        s = np.linspace(0.0, 1.0, self.samples + 1)
+        fraction = np.tile(s, count)
+        segment = np.repeat(np.arange(count), len(s))
+
+        poses = np.empty((len(fraction), 6))
+        poses[:, :3] = (1 - fraction)[:, None] * starts[segment, :3] + fraction[:, None] * targets[segment, :3]
+        q0 = rotvectoquat_batch(starts[:, 3:])
+        q1 = rotvectoquat_batch(targets[:, 3:])
+        poses[:, 3:] = quattorotvec_batch(slerp_batch(q0[segment], q1[segment], fraction))
+
+        solutions, valid = self.kinematics.solve(poses)
+        solutions = solutions.reshape(count, len(s), 8, 6)
+        valid = valid.reshape(count, len(s), 8)
+
+        # stay on the branch the arm is on, every segment starts from the end of the one before
+        joints = np.full((count, len(s), 6), np.nan)
+        current = np.asarray(start_joints, dtype=np.float64)
+        for i in range(count):
+            segment_joints, ok = nearest_solution(solutions[i], valid[i], current)
+            joints[i, ok] = segment_joints[ok]
+            if ok[-1]:
+                current = segment_joints[-1]
+        return joints
+
+    def schedule(self, poses_ready, start_pose, start_joints):
+        # poses_ready (N, 6) x, y, z, rx, ry, rz -> dict with per segment "vel", "acc", "radius", "duration"
+        # and "timeline", the predicted arrival at every waypoint in seconds from the start
+        targets = np.asarray(poses_ready, dtype=np.float64).reshape(-1, 6)
+        starts = np.vstack((np.asarray(start_pose, dtype=np.float64).reshape(1, 6), targets[:-1]))
+
+        # movel covers the translation or the rotation, whichever takes longer, at the same vel and acc
+        lengths = np.linalg.norm(targets[:, :3] - starts[:, :3], axis=1)
+        distance = np.maximum(lengths, np.linalg.norm(targets[:, 3:] - starts[:, 3:], axis=1))
+
+        # joint motion per unit of tool path, joint speed = rate * tool speed / distance
+        joints = self.segment_joints(starts, targets, start_joints)
+        rate = np.abs(np.diff(joints, axis=1)) * self.samples
+        rate = np.nan_to_num(np.nanmax(rate, axis=1, initial=0.0))  # (N, 6), segments without IK only get the tool caps
+
+        # a zero length segment (repeated waypoint) has nothing to limit, it gets the tool caps and takes no time
+        moving = (rate > 0) & (distance[:, None] > 1e-9)
+        vel = np.min(np.divide(self.joint_vel * distance[:, None], rate, out=np.full(rate.shape, np.inf), where=moving), axis=1)
+        acc = np.min(np.divide(self.joint_acc * distance[:, None], rate, out=np.full(rate.shape, np.inf), where=moving), axis=1)
+        vel = np.minimum(vel, self.max_vel)
+        acc = np.minimum(acc, self.max_acc)
+
+        # the largest blend that still fits, half of the shorter segment next to the waypoint, none on pure rotations
+        radius = np.zeros(len(targets))
+        if len(targets) > 1:
+            limits = 0.5 * np.minimum(lengths[:-1], lengths[1:])
+            radius[:-1] = np.where(limits > 1e-3, np.minimum(limits, self.max_radius), 0.0)
+
+        duration = linear_move_duration(starts, targets, vel, acc)
+        return {"vel": vel, "acc": acc, "radius": radius, "duration": duration, "timeline": np.cumsum(duration)}
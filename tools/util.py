@@ -1,26 +1,161 @@
-
 import math
+import functools
 import numpy as np
 
 
-def rpytorotvec(angles):
-    roll, pitch, yaw = angles
-    roll, pitch, yaw = math.radians(roll), math.radians(pitch), math.radians(yaw)
-    yawMatrix   = np.matrix([[math.cos(yaw), -math.sin(yaw), 0],[math.sin(yaw), math.cos(yaw), 0],[0, 0, 1]])
-    pitchMatrix = np.matrix([[math.cos(pitch), 0, math.sin(pitch)],[0, 1, 0],[-math.sin(pitch), 0, math.cos(pitch)]])
-    rollMatrix  = np.matrix([[1, 0, 0],[0, math.cos(roll), -math.sin(roll)],[0, math.sin(roll), math.cos(roll)]])
+def rpytoquat_batch(angles):
+    # angles (N, 3) roll, pitch, yaw in degrees -> quaternions (N, 4) as (w, x, y, z), R = Rz(yaw) * Ry(pitch) * Rx(roll)
+    half = np.radians(np.asarray(angles, dtype=np.float64)) * 0.5
+    cr, cp, cy = np.cos(half[:, 0]), np.cos(half[:, 1]), np.cos(half[:, 2])
+    sr, sp, sy = np.sin(half[:, 0]), np.sin(half[:, 1]), np.sin(half[:, 2])
+
+    quat = np.empty((half.shape[0], 4))
+    quat[:, 0] = cr * cp * cy + sr * sp * sy
+    quat[:, 1] = sr * cp * cy - cr * sp * sy
+    quat[:, 2] = cr * sp * cy + sr * cp * sy
+    quat[:, 3] = cr * cp * sy - sr * sp * cy
+    return quat
+
+
+def quattorotvec_batch(quat):
+    # quaternions (N, 4) -> rotation vectors (N, 3) with theta in [0, pi]
+    quat = np.asarray(quat, dtype=np.float64)
+    sign = np.where(quat[:, 0] < 0, -1.0, 1.0)  # same rotation, keep w >= 0 so theta <= pi
+    w = quat[:, 0] * sign
+    v = quat[:, 1:] * sign[:, None]
+
+    sin_half = np.linalg.norm(v, axis=1)
+    theta = 2 * np.arctan2(sin_half, w)
+
+    # theta / sin(theta / 2) tends to 2 when theta -> 0, avoid the 0 / 0
+    small = sin_half < 1e-12
+    scale = np.where(small, 2.0, theta / np.where(small, 1.0, sin_half))
+    return v * scale[:, None]
+
+
+def quat_multiply(a, b):
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return (aw * bw - ax * bx - ay * by - az * bz,
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw)
+
+
+def rotvectoquat_batch(rotvec):
+    # rotation vectors (N, 3) -> quaternions (N, 4) as (w, x, y, z)
+    rotvec = np.asarray(rotvec, dtype=np.float64)
+    theta = np.linalg.norm(rotvec, axis=1)
+    small = theta < 1e-12
+    # sin(theta / 2) / theta tends to 1 / 2 when theta -> 0
+    scale = np.where(small, 0.5, np.sin(theta / 2) / np.where(small, 1.0, theta))
+    return np.column_stack((np.cos(theta / 2), rotvec * scale[:, None]))
+
+
+def quattorpy_batch(quat):
+    # quaternions (N, 4) -> (N, 3) roll, pitch, yaw in degrees, inverse of rpytoquat_batch away from pitch = +-90
+    w, x, y, z = (np.asarray(quat, dtype=np.float64)[:, i] for i in range(4))
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1.0, 1.0))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return np.degrees(np.column_stack((roll, pitch, yaw)))
+
+
+def slerp_batch(q0, q1, s):
+    # (N, 4) quaternions and (N,) fractions -> (N, 4), along the shorter arc like movel
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    s = np.asarray(s, dtype=np.float64)[:, None]
+    dot = np.sum(q0 * q1, axis=1)
+    q1 = np.where((dot < 0)[:, None], -q1, q1)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))[:, None]
+    sin_theta = np.sin(theta)
+    close = sin_theta < 1e-9  # plain interpolation when the two are (almost) the same rotation
+    safe = np.where(close, 1.0, sin_theta)
+    w0 = np.where(close, 1 - s, np.sin((1 - s) * theta) / safe)
+    w1 = np.where(close, s, np.sin(s * theta) / safe)
+    quat = w0 * q0 + w1 * q1
+    return quat / np.linalg.norm(quat, axis=1)[:, None]
 
-    R = yawMatrix * pitchMatrix * rollMatrix
-    theta = math.acos(((R[0, 0] + R[1, 1] + R[2, 2]) - 1) / 2)
-    multi = 1 / (2 * math.sin(theta))
 
-    rx = multi * (R[2, 1] - R[1, 2]) * theta
-    ry = multi * (R[0, 2] - R[2, 0]) * theta
-    rz = multi * (R[1, 0] - R[0, 1]) * theta
-    return rx, ry, rz
+def rpytorotvec_batch(angles):
+    # (N, 3) roll, pitch, yaw in degrees -> (N, 3) rx, ry, rz
+    # Going through the quaternion keeps theta ~ 0 and theta ~ pi well defined, unlike 1 / (2 * sin(theta))
+    return quattorotvec_batch(rpytoquat_batch(angles))
+
+
+class PitchRotvec:
+    # Closed form for orientations where roll and yaw are fixed and only pitch moves:
+    # Rz(yaw) * Ry(pitch) * Rx(roll) as a quaternion is cos(pitch / 2) * q0 + sin(pitch / 2) * q1
+    def __init__(self, roll, yaw, cache_size=1024):
+        self.roll = roll
+        self.yaw = yaw
+        roll, yaw = math.radians(roll), math.radians(yaw)
+        qz = (math.cos(yaw / 2), 0.0, 0.0, math.sin(yaw / 2))
+        qx = (math.cos(roll / 2), math.sin(roll / 2), 0.0, 0.0)
+        self.q0 = np.array(quat_multiply(qz, qx))
+        self.q1 = np.array(quat_multiply(quat_multiply(qz, (0.0, 0.0, 1.0, 0.0)), qx))
+        self.q0_tuple = tuple(self.q0.tolist())
+        self.q1_tuple = tuple(self.q1.tolist())
+
+        # exact repeats such as home and the scripted waypoints skip the math altogether
+        self.cached = functools.lru_cache(maxsize=cache_size)(self.compute)
+
+    def compute(self, pitch):
+        half = math.radians(pitch) / 2
+        c, s = math.cos(half), math.sin(half)
+        w, x, y, z = (c * a + s * b for a, b in zip(self.q0_tuple, self.q1_tuple))
+        if w < 0:
+            w, x, y, z = -w, -x, -y, -z
+        sin_half = math.sqrt(x * x + y * y + z * z)
+        scale = 2.0 if sin_half < 1e-12 else 2 * math.atan2(sin_half, w) / sin_half
+        return x * scale, y * scale, z * scale
+
+    def __call__(self, pitch):
+        return self.cached(float(pitch))
+
+    def batch(self, pitches):
+        # (N,) pitch in degrees -> (N, 3) rx, ry, rz
+        half = np.radians(np.asarray(pitches, dtype=np.float64)) / 2
+        quat = np.cos(half)[:, None] * self.q0 + np.sin(half)[:, None] * self.q1
+        return quattorotvec_batch(quat)
+
+
+def prepare_points(poses):
+    # (N, 6) x, y, z, roll, pitch, yaw poses -> (N, 6) x, y, z, rx, ry, rz poses ready for movel
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+    poses_ready = np.empty_like(poses)
+    poses_ready[:, :3] = poses[:, :3]
+    poses_ready[:, 3:] = rpytorotvec_batch(poses[:, 3:])
+    return poses_ready
+
+
+def rpytorotvec(angles):
+    rx, ry, rz = rpytorotvec_batch(np.asarray(angles, dtype=np.float64).reshape(1, 3))[0]
+    return float(rx), float(ry), float(rz)
 
 
 def prepare_point(pose):
     rx, ry, rz = rpytorotvec(pose[-3:])
-    pose_ready = pose[:3] + (rx, ry, rz)
+    pose_ready = tuple(pose[:3]) + (rx, ry, rz)
     return pose_ready
+
+
+def trapezoid_duration(distance, vel, acc):
+    # time to cover distance from rest to rest with a trapezoidal velocity profile, triangular when vel is never reached
+    distance = np.abs(np.asarray(distance, dtype=np.float64))
+    ramp_distance = vel ** 2 / acc
+    triangular = 2 * np.sqrt(distance / acc)
+    trapezoidal = distance / vel + vel / acc
+    return np.where(distance < ramp_distance, triangular, trapezoidal)
+
+
+def linear_move_duration(start_pose, target_pose, vel, acc):
+    # movel time between two x, y, z, rx, ry, rz poses, the slower of translation and rotation sets it
+    start_pose = np.asarray(start_pose, dtype=np.float64)
+    target_pose = np.asarray(target_pose, dtype=np.float64)
+    distance = np.linalg.norm(target_pose[..., :3] - start_pose[..., :3], axis=-1)
+    rotation = np.linalg.norm(target_pose[..., 3:] - start_pose[..., 3:], axis=-1)
+    return np.maximum(trapezoid_duration(distance, vel, acc), trapezoid_duration(rotation, vel, acc))
@@ -1,13 +1,20 @@
 import os
 import json
-import urx
+import queue
 import logging
-logging.basicConfig(level=logging.INFO)
+import threading
 import collections
 collections.Iterable = collections.abc.Iterable # Need this for math3d lib issues
 from environment.main_environment_ur5 import Environment
+from environment.sim_robot import SimRobot
+from environment.safety_watchdog import SafetyWatchdog
+from tools.instrumentation import Instrumentation
+from tools.scheduler import WaypointScheduler
+from tools.log_pipeline import LogPipeline
 import time
 
+logger = logging.getLogger(__name__)
+
 
 def read_config_file():
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,23 +25,162 @@ def read_config_file():
     return config
 
 
+def create_robot(config):
+    use_rt = config.get('use_rt', False)  # realtime stream for Environment.get_state
+    if config.get('robot_backend', 'urx') == 'sim':
+        return SimRobot(fast_forward=config.get('sim_fast_forward', True), use_rt=use_rt)
+
+    import urx  # only needed for the real arm, so headless runs work without it
+    ip_address_robot = config['ip_robot']
+
+    if use_rt:
+        return urx.Robot(ip_address_robot, use_rt=True, urFirm=config['urFirm'])
+    return urx.Robot(ip_address_robot)
+
+
+def robot_configs(config):
+    # "robots" is a list of per-robot overrides of the top level keys, without it the single ip_robot is used
+    robots = config.get('robots') or [{}]
+    configs = []
+    for i, robot in enumerate(robots):
+        robot_config = dict(config, **robot)
+        robot_config.setdefault('name', robot_config.get('ip_robot', f'robot{i}'))
+        configs.append(robot_config)
+    return configs
+
+
+class RobotWorker:
+    # Runs the episodes of one robot in its own thread, a failure only ends this robot
+    def __init__(self, config, experience, instrumentation, episodes=10):
+        self.config = config
+        self.name = config['name']
+        self.experience = experience  # shared queue, one record per finished episode
+        self.episodes = episodes
+
+        self.status = "starting"
+        self.error = None
+        self.episodes_done = 0
+        self.last_update = time.monotonic()
+        self.instrumentation = instrumentation
+        self.watchdog = None
+        self.thread = threading.Thread(target=self.run, name=f"robot-{self.name}", daemon=True)
+
+    def set_status(self, status):
+        self.status = status
+        self.last_update = time.monotonic()
+
+    def health(self, stall_timeout):
+        # a running robot that has not finished an episode in stall_timeout seconds is reported as stalled
+        if self.status == "running" and time.monotonic() - self.last_update > stall_timeout:
+            return "stalled"
+        return self.status
+
+    def run(self):
+        robot = None
+        env = None
+        try:
+            def robot_factory():
+                return self.instrumentation.wrap_robot(create_robot(self.config))
+
+            robot = robot_factory()
+            env = self.instrumentation.wrap_environment(Environment(robot, velocity=self.config['velocity'], acceleration=self.config['acceleration']))
+            if self.config.get('time_optimal_schedule', False):
+                env.scheduler = WaypointScheduler(max_vel=self.config['velocity'], max_acc=self.config['acceleration'])
+            if self.config.get('safety_watchdog', False):
+                # protective stops, lost connections and halted programs are recovered and the episode is started again
+                self.watchdog = SafetyWatchdog(env, robot_factory=robot_factory, recovery=self.config.get('recovery'))
+                self.watchdog.start()
+            #env.starting_position()  # just making sure the joint are in the right position for initialization
+            self.set_status("running")
+
+            env.robot_home_position()
+            recoveries = 0
+            while self.episodes_done < self.episodes:
+                try:
+                    with self.instrumentation.phase('action'):
+                        env.hard_code_solution()
+                    state = env.get_state()
+                    with self.instrumentation.phase('reset'):
+                        env.reset_task()
+                except Exception as e:
+                    if self.watchdog is None or recoveries >= self.config.get('max_recoveries', 20):
+                        raise
+                    self.set_status("recovering")
+                    recoveries += 1
+                    if not self.watchdog.handle(e):
+                        raise
+                    self.set_status("running")
+                    continue
+                self.instrumentation.end_episode()
+                self.experience.put({"robot": self.name, "episode": self.episodes_done, "state": state, "time": time.time()})
+                self.episodes_done += 1
+                self.set_status("running")
+            env.robot_home_position()
+            self.set_status("done")
+        except Exception as e:
+            logger.error(f"Robot {self.name} failed: {e!r}")
+            self.error = repr(e)
+            self.set_status("failed")
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.stop()
+            if env is not None:
+                robot = env.robot  # a reconnect may have replaced it
+            if robot is not None:
+                try:
+                    robot.close()
+                except Exception as e:
+                    logger.error(f"Robot {self.name} did not close cleanly: {e!r}")
+
+    def start(self):
+        self.thread.start()
+
+
 def main():
     config = read_config_file()
-    ip_address_robot = config['ip_robot']
+    # logs go through a queue to a background thread, repeated messages from one place are rate limited
+    log_pipeline = LogPipeline(level=config.get('log_level', 'INFO'), rate=config.get('log_rate', 5.0))
+    try:
+        run(config)
+    finally:
+        logger.info("Log pipeline: %s", log_pipeline.stats())
+        log_pipeline.stop()
+
 
-    # robot = urx.Robot(ip_address_robot, use_rt=True, urFirm=config['urFirm'])
+def run(config):
+    # each robot gets its own timers, their episode phases would mix otherwise
+    instrumented = config.get('instrumentation', False)
+    configs = robot_configs(config)
+    experience = queue.Queue()
+    workers = []
+    for robot_config in configs:
+        workers.append(RobotWorker(robot_config, experience, Instrumentation(enabled=instrumented), episodes=config.get('episodes', 10)))
+    for worker in workers:
+        worker.start()
 
-    robot = urx.Robot(ip_address_robot)
-    env = Environment(robot, velocity=config['velocity'], acceleration=config['acceleration'])
-    #env.starting_position()  # just making sure the joint are in the right position for initialization
+    # one stream of episodes from every robot, health is logged whenever it goes quiet
+    stall_timeout = config.get('stall_timeout', 60.0)
+    collected = []
+    while any(worker.thread.is_alive() for worker in workers) or not experience.empty():
+        try:
+            record = experience.get(timeout=1.0)
+        except queue.Empty:
+            logger.info("Robot health: " + ", ".join(f"{worker.name} {worker.health(stall_timeout)} ({worker.episodes_done} episodes)" for worker in workers))
+            continue
+        collected.append(record)
+        logger.info(f"Episode {record['episode']} from {record['robot']}")
 
-    env.robot_home_position()
-    for i in range(10):
-        env.hard_code_solution()
-        env.reset_task()
-    env.robot_home_position()
+    for worker in workers:
+        logger.info(f"Robot {worker.name}: {worker.status}, {worker.episodes_done} episodes" + (f", {worker.error}" if worker.error else ""))
+        if worker.watchdog is not None:
+            logger.info(f"Robot {worker.name} faults: {worker.watchdog.summary()}")
 
-    robot.close()
+    if instrumented:
+        output = config.get('instrumentation_output', 'instrumentation')
+        for worker in workers:
+            path = output if len(workers) == 1 else f"{output}_{worker.name}"
+            worker.instrumentation.export_json(path + '.json')
+            worker.instrumentation.export_csv(path + '.csv')
 
 
 if __name__ == "__main__":